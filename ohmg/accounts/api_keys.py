@@ -0,0 +1,117 @@
+"""
+Cached API key checks and batched usage counts.
+
+The status of each key is cached in-process and in the shared Django cache for
+settings.API_KEY_CACHE_TTL seconds. Saving or deleting a key drops it from both, though
+other processes may keep using their own copy until it expires. Each use of a key is
+counted in memory by the key's pk (so key values never reach the broker or the logs),
+and the counts are handed to a Celery task that writes them to the database once
+settings.API_KEY_COUNT_FLUSH_INTERVAL seconds have passed since the last write. Any
+remaining counts are written directly when the process exits.
+"""
+
+import atexit
+import hashlib
+import logging
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F
+
+logger = logging.getLogger(__name__)
+
+ACTIVE = "active"
+INACTIVE = "inactive"
+UNKNOWN = "unknown"
+
+## guards against unbounded growth from requests with made-up keys
+LOCAL_CACHE_MAX_SIZE = 10000
+
+_local_status = {}
+_counts = Counter()
+_counts_lock = threading.Lock()
+_last_flush = time.monotonic()
+
+
+def _cache_key(key):
+    ## hash the value so that keys don't show up in the cache backend
+    return f"api-key-status-{hashlib.sha256(key.encode()).hexdigest()}"
+
+
+def get_key_status(key: str) -> tuple:
+    """Returns (status, pk) for this API key value, where status is ACTIVE, INACTIVE, or
+    UNKNOWN (no such key, in which case pk is None)."""
+    from .models import APIKey
+
+    now = time.monotonic()
+    entry = _local_status.get(key)
+    if entry and entry[1] > now:
+        return entry[0]
+
+    result = cache.get(_cache_key(key))
+    if result is None:
+        row = APIKey.objects.filter(value=key).values_list("active", "pk").first()
+        if row is None:
+            result = (UNKNOWN, None)
+        else:
+            result = (ACTIVE if row[0] else INACTIVE, row[1])
+        cache.set(_cache_key(key), result, timeout=settings.API_KEY_CACHE_TTL)
+
+    if len(_local_status) >= LOCAL_CACHE_MAX_SIZE:
+        _local_status.clear()
+    _local_status[key] = (tuple(result), now + settings.API_KEY_CACHE_TTL)
+    return tuple(result)
+
+
+def invalidate_key(key: str):
+    _local_status.pop(key, None)
+    cache.delete(_cache_key(key))
+
+
+def write_key_counts(counts: dict):
+    from .models import APIKey
+
+    for pk, count in counts.items():
+        APIKey.objects.filter(pk=pk).update(request_count=F("request_count") + count)
+
+
+def _take_counts() -> dict:
+    global _last_flush
+    with _counts_lock:
+        counts = dict(_counts)
+        _counts.clear()
+        _last_flush = time.monotonic()
+    return counts
+
+
+def record_key_use(pk: int):
+    """Count one use of the key with this pk, and hand the accumulated counts off to be
+    written if it has been long enough since the last write."""
+    with _counts_lock:
+        _counts[pk] += 1
+        if time.monotonic() - _last_flush < settings.API_KEY_COUNT_FLUSH_INTERVAL:
+            return
+    counts = _take_counts()
+    if not counts:
+        return
+
+    from .tasks import write_api_key_counts_as_task
+
+    try:
+        write_api_key_counts_as_task.apply_async((counts,))
+    except Exception as e:
+        logger.warning(f"can't queue API key counts, writing them directly: {e}")
+        write_key_counts(counts)
+
+
+@atexit.register
+def flush_key_counts():
+    counts = _take_counts()
+    if counts:
+        try:
+            write_key_counts(counts)
+        except Exception as e:
+            logger.warning(f"lost API key counts on exit: {counts} ({e})")
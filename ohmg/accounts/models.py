@@ -3,6 +3,8 @@ import secrets
 from django.conf import settings
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 from django.urls import reverse
 from django.utils.functional import cached_property
 
@@ -32,13 +34,37 @@ class User(AbstractUser):
     def api_keys(self):
         return [i for i in APIKey.objects.filter(account=self).values_list("value", flat=True)]
 
-    def update_sesh_counts(self):
-        self.load_ct = Map.objects.filter(loaded_by=self).count()
-        self.psesh_ct = SessionBase.objects.filter(user=self, type="p").count()
-        self.gsesh_ct = SessionBase.objects.filter(user=self, type="g").count()
-        self.gcp_ct = GCP.objects.filter(created_by=self).count()
-        self.save(
-            update_fields=["load_ct", "psesh_ct", "gsesh_ct", "gcp_ct"],
+    @classmethod
+    def adjust_counts(cls, user_id: int, **deltas):
+        """Atomically add to (or subtract from) the contribution counters of a user, e.g.
+        User.adjust_counts(user.pk, psesh_ct=1). Does nothing if user_id is None."""
+        if user_id is not None:
+            cls.objects.filter(pk=user_id).update(
+                **{field: F(field) + delta for field, delta in deltas.items()}
+            )
+
+    @classmethod
+    def reconcile_counts(cls, queryset=None) -> int:
+        """Recount the contribution counters for all users (or those in queryset) in a
+        single UPDATE, to correct any drift in the counts maintained by adjust_counts().
+        Returns the number of users updated."""
+
+        def count(model, field, **filters):
+            subquery = (
+                model.objects.filter(**{field: OuterRef("pk")}, **filters)
+                .order_by()
+                .values(field)
+                .annotate(ct=Count("pk"))
+                .values("ct")
+            )
+            return Coalesce(Subquery(subquery), 0)
+
+        queryset = queryset if queryset is not None else cls.objects.all()
+        return queryset.update(
+            load_ct=count(Map, "loaded_by"),
+            psesh_ct=count(SessionBase, "user", type="p"),
+            gsesh_ct=count(SessionBase, "user", type="g"),
+            gcp_ct=count(GCP, "created_by"),
         )
 
 
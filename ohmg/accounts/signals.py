@@ -0,0 +1,17 @@
+from django.db.models import signals
+from django.dispatch import receiver
+
+from ohmg.core.models import Map
+
+from .api_keys import invalidate_key
+from .models import APIKey, User
+
+
+@receiver([signals.post_delete, signals.post_save], sender=APIKey)
+def invalidate_api_key_cache(sender, instance, **kwargs):
+    invalidate_key(instance.value)
+
+
+@receiver([signals.post_delete], sender=Map)
+def update_user_load_ct(sender, instance, **kwargs):
+    User.adjust_counts(instance.loaded_by_id, load_ct=-1)
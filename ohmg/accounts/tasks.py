@@ -0,0 +1,14 @@
+from ohmg.conf.celery import app
+
+from .api_keys import write_key_counts
+from .models import User
+
+
+@app.task
+def write_api_key_counts_as_task(counts):
+    write_key_counts(counts)
+
+
+@app.task
+def reconcile_user_counts():
+    User.reconcile_counts()
@@ -1,9 +1,16 @@
+import math
 from typing import List, Optional
 
+from django.conf import settings
+from django.contrib.gis.db.models.functions import Area, Distance, Intersection
+from django.contrib.gis.gdal import GDALException
+from django.contrib.gis.geos import GEOSException, GEOSGeometry, Point, Polygon
+from django.contrib.gis.measure import D
 from ninja import (
     Field,
     FilterSchema,
 )
+from ninja.errors import HttpError
 
 
 class FilterSessionSchema(FilterSchema):
@@ -35,3 +42,96 @@ class FilterRegionSchema(FilterSchema):
     map: Optional[str] = Field(q="document__map_id")
     document: Optional[str] = Field(q="document_id")
     prepared: Optional[bool] = Field(q="prepared")
+
+
+def _parse_floats(value: str, count: int, name: str) -> list:
+    try:
+        floats = [float(i) for i in value.split(",")]
+    except ValueError:
+        floats = []
+    if len(floats) != count:
+        raise HttpError(400, f"{name} must be {count} comma-separated numbers")
+    return floats
+
+
+def filter_by_location(
+    queryset,
+    field: str = "footprint",
+    bbox: str = None,
+    intersects: str = None,
+    near: str = None,
+    radius: float = 1000,
+):
+    """Spatially filter a queryset on the given geometry field (an indexed footprint).
+
+        bbox:       "minx,miny,maxx,maxy" in WGS84
+        intersects: any geometry, as GeoJSON or WKT in WGS84
+        near:       "lon,lat", combined with radius in meters
+
+    bbox/intersects results are annotated with overlap (the area shared with the input
+    geometry) and ordered by it, largest first. near results are annotated with distance
+    (meters) and ordered by it, closest first; if both are given, distance wins."""
+
+    if bbox or intersects:
+        if bbox:
+            geom = Polygon.from_bbox(_parse_floats(bbox, 4, "bbox"))
+            geom.srid = 4326
+        else:
+            try:
+                geom = GEOSGeometry(intersects)
+            except (ValueError, GEOSException, GDALException):
+                raise HttpError(400, "intersects must be a valid GeoJSON or WKT geometry")
+            ## input without a CRS is taken as WGS84, anything else is transformed to it
+            if geom.srid is None:
+                geom.srid = 4326
+            elif geom.srid != 4326:
+                try:
+                    geom.transform(4326)
+                except (GEOSException, GDALException):
+                    raise HttpError(400, f"intersects has an unsupported CRS: {geom.srid}")
+        queryset = (
+            queryset.filter(**{f"{field}__intersects": geom})
+            .annotate(overlap=Area(Intersection(field, geom)))
+            .order_by("-overlap")
+        )
+
+    if near:
+        lon, lat = _parse_floats(near, 2, "near")
+        point = Point(lon, lat, srid=4326)
+        ## first use the spatial index to narrow to a box (in degrees) that is sure to
+        ## contain the radius, then calculate the real distance on the remaining rows
+        degrees = radius / 111320 / max(math.cos(math.radians(lat)), 0.01)
+        queryset = (
+            queryset.filter(**{f"{field}__dwithin": (point, degrees)})
+            .annotate(distance=Distance(field, point))
+            .filter(distance__lte=D(m=radius))
+            .order_by("distance")
+        )
+
+    return queryset
+
+
+def limit_location_results(queryset, limit: int = None, offset: int = 0) -> tuple:
+    """Returns one page of a queryset that was spatially filtered with no other bounds,
+    along with the total number of matches, so that a large area can't produce an
+    unbounded response. limit defaults to (and can't exceed)
+    settings.SPATIAL_QUERY_MAX_RESULTS. The spatial ordering (overlap or distance) is
+    kept, with pk breaking ties so that pages don't shift."""
+    max_limit = settings.SPATIAL_QUERY_MAX_RESULTS
+    limit = max_limit if limit is None else min(max(limit, 0), max_limit)
+    offset = max(offset, 0)
+    total = queryset.order_by().count()
+    queryset = queryset.order_by(*queryset.query.order_by, "pk")
+    return queryset[offset : offset + limit], total
+
+
+def set_location_result_headers(request, response, total: int, offset: int, count: int):
+    """Tells the client how a limited location query was truncated: X-Total-Count holds
+    the number of matches, and a Link header points to the next page if there is one."""
+    response["X-Total-Count"] = str(total)
+    next_offset = max(offset, 0) + count
+    if count and next_offset < total:
+        params = request.GET.copy()
+        params["offset"] = next_offset
+        url = request.build_absolute_uri(request.path)
+        response["Link"] = f'<{url}?{params.urlencode()}>; rel="next"'
@@ -1,8 +1,20 @@
-from typing import Any, List
+import base64
+import datetime
+import hashlib
+import json
+import uuid
+from typing import Any, List, Optional
 
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet, ValidationError
+from django.db import connection
+from django.db.models import Q
 from natsort import natsorted
-from ninja import Schema
+from ninja import Field, Schema
+from ninja.conf import settings as ninja_settings
+from ninja.errors import HttpError
 from ninja.pagination import PaginationBase
 
 from ohmg.accounts.models import User
@@ -15,53 +27,224 @@ from ohmg.georeference.models import (
 from ohmg.places.models import Place
 
 
+def get_count(queryset) -> int:
+    """Returns queryset.count(), unless the queryset is unfiltered and its table is large,
+    in which case the planner's row estimate for the table is returned instead (which
+    is much faster than a full count, but can be off by a few percent)."""
+    if not queryset.query.where:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+                [queryset.model._meta.db_table],
+            )
+            row = cursor.fetchone()
+        if row and row[0] >= settings.PAGINATION_ESTIMATED_COUNT_MIN:
+            return row[0]
+    return queryset.count()
+
+
+def get_filter_items(name, queryset, func) -> dict:
+    """Returns func(queryset), cached for settings.PAGINATION_FACET_CACHE_TTL seconds
+    under a key made from the queryset's SQL, so each set of filters gets its own entry."""
+    try:
+        sql = str(queryset.order_by().query)
+    except EmptyResultSet:
+        return func(queryset)
+    key = f"filter-items-{name}-{hashlib.md5(sql.encode()).hexdigest()}"
+    filter_items = cache.get(key)
+    if filter_items is None:
+        filter_items = func(queryset)
+        cache.set(key, filter_items, timeout=settings.PAGINATION_FACET_CACHE_TTL)
+    return filter_items
+
+
+def get_session_filter_items(queryset) -> dict:
+    queryset = queryset.order_by()
+
+    types_unique = set(queryset.values_list("type", flat=True).distinct())
+    type_items = [{"id": i[0], "label": i[1]} for i in SESSION_TYPES if i[0] in types_unique]
+
+    usernames = get_user_model().objects.filter(pk__in=queryset.values("user"))
+    user_items = natsorted(
+        [{"id": i, "label": i} for i in usernames.values_list("username", flat=True)],
+        key=lambda k: k["id"],
+    )
+
+    maps = Map.objects.filter(pk__in=queryset.values("map"))
+    map_items = natsorted(
+        [{"id": i[0], "label": i[1]} for i in maps.values_list("identifier", "title")],
+        key=lambda k: k["label"],
+    )
+
+    return {
+        "types": type_items,
+        "users": user_items,
+        "maps": map_items,
+    }
+
+
+def get_map_filter_items(queryset) -> dict:
+    queryset = queryset.order_by()
+
+    places = Place.objects.filter(pk__in=queryset.values("locales"))
+    place_items = natsorted(
+        [{"id": i[0], "label": i[1]} for i in places.values_list("slug", "display_name")],
+        key=lambda k: k["id"],
+    )
+
+    usernames = User.objects.filter(pk__in=queryset.values("loaded_by"))
+    user_items = natsorted(
+        [{"id": i, "label": i} for i in usernames.values_list("username", flat=True)],
+        key=lambda k: k["id"],
+    )
+
+    return {
+        "places": place_items,
+        "users": user_items,
+    }
+
+
+def _cursor_value(value):
+    ## isoformat() keeps the microseconds, which DjangoJSONEncoder would cut down to
+    ## milliseconds, causing rows to be skipped or repeated at the page boundaries
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    return value
+
+
+def _encode_cursor(obj, fields: list, backwards: bool) -> str:
+    values = [_cursor_value(getattr(obj, i)) for i in fields]
+    content = json.dumps({"v": values, "b": backwards})
+    return base64.urlsafe_b64encode(content.encode()).decode()
+
+
+def _decode_cursor(model, cursor: str, fields: list) -> tuple:
+    try:
+        content = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        values = [
+            model._meta.get_field(i).to_python(v) if i != "pk" else model._meta.pk.to_python(v)
+            for i, v in zip(fields, content["v"], strict=True)
+        ]
+        return values, bool(content["b"])
+    except (ValueError, KeyError, TypeError, ValidationError):
+        raise HttpError(400, "invalid cursor")
+
+
+def paginate_by_keyset(queryset, ordering: list, cursor: str, limit: int) -> dict:
+    """Returns a page of items from queryset that follows (or precedes) the position
+    stored in cursor, by filtering on the ordering fields rather than using an offset,
+    so that fetching a deep page costs the same as fetching the first. The ordering
+    must be unique, e.g. end with pk. An empty cursor returns the first page.
+
+    Returns "items", and the cursors for the "next" and "previous" pages (None if there
+    isn't one)."""
+
+    fields = [i.lstrip("-") for i in ordering]
+    position, backwards = None, False
+    if cursor:
+        position, backwards = _decode_cursor(queryset.model, cursor, fields)
+
+    descending = [i.startswith("-") for i in ordering]
+    if backwards:
+        descending = [not i for i in descending]
+    queryset = queryset.order_by(*[f"-{f}" if d else f for f, d in zip(fields, descending)])
+
+    if position is not None:
+        ## (a, b) > (x, y) is expanded to a > x OR (a = x AND b > y)
+        after = Q()
+        for n, (field, desc) in enumerate(zip(fields, descending)):
+            match = {f: v for f, v in zip(fields[:n], position[:n])}
+            match[f"{field}__{'lt' if desc else 'gt'}"] = position[n]
+            after |= Q(**match)
+        queryset = queryset.filter(after)
+
+    items = list(queryset[: limit + 1])
+    has_more = len(items) > limit
+    items = items[:limit]
+    if backwards:
+        items.reverse()
+
+    next_exists = has_more if not backwards else True
+    previous_exists = position is not None if not backwards else has_more
+    return {
+        "items": items,
+        "next": _encode_cursor(items[-1], fields, False) if items and next_exists else None,
+        "previous": _encode_cursor(items[0], fields, True) if items and previous_exists else None,
+    }
+
+
+class KeysetPagination(PaginationBase):
+    """Limit/offset pagination, or keyset pagination if a cursor is passed (use an empty
+    cursor to get the first page). In keyset mode, the items are sorted by the ordering
+    given to @paginate(KeysetPagination, ordering=[...]), and the total count is only
+    included if count=true."""
+
+    class Input(Schema):
+        limit: int = Field(ninja_settings.PAGINATION_PER_PAGE, ge=1)
+        offset: int = Field(0, ge=0)
+        cursor: Optional[str] = None
+        count: bool = False
+
+    class Output(Schema):
+        items: List[Any]
+        count: Optional[int]
+        next: Optional[str]
+        previous: Optional[str]
+
+    def __init__(self, ordering: list = ("-date_created", "-pk"), **kwargs):
+        self.ordering = list(ordering)
+        super().__init__(**kwargs)
+
+    def paginate_queryset(self, queryset, pagination: Input, **params):
+        if pagination.cursor is None:
+            offset = pagination.offset
+            return {
+                "items": queryset[offset : offset + pagination.limit],
+                "count": get_count(queryset),
+            }
+        page = paginate_by_keyset(queryset, self.ordering, pagination.cursor, pagination.limit)
+        page["count"] = get_count(queryset) if pagination.count else None
+        return page
+
+
 class SessionPagination(PaginationBase):
+    """Supports keyset pagination (newest first) when a cursor is passed, like
+    KeysetPagination."""
+
     class Input(Schema):
         offset: int = 0
         limit: int = 10
+        ## set to false to skip the filter items, e.g. when only flipping pages
+        facets: bool = True
+        cursor: Optional[str] = None
+        count: bool = False
 
     class Output(Schema):
         items: List[Any]
-        count: int
+        count: Optional[int]
         filter_items: dict
+        next: Optional[str]
+        previous: Optional[str]
 
     def paginate_queryset(self, queryset, pagination: Input, **params):
-        ## Crazy, this commented code was the first attempt and making a unique list of
-        ## session types that only exist in the queryset, but it is way slower than the
-        ## solution in use further below.
-        ## The set() strategy takes ~.3 seconds, the other ~.002
-        # types_unique = set(queryset.values_list("type", flat=True))
-        # type_items = [{"id":i[0], "label":i[1]} for i in SESSION_TYPES if i[0] in types_unique]
-
-        type_items = []
-        for t in SESSION_TYPES:
-            if queryset.filter(type=t[0]).exists():
-                type_items.append({"id": t[0], "label": t[1]})
-
-        user_ids = queryset.values_list("user", flat=True)
-        users = get_user_model().objects.filter(pk__in=user_ids)
-        user_items = natsorted(
-            [{"id": i.username, "label": i.username} for i in users],
-            key=lambda k: k["id"],
-        )
-
-        map_ids = queryset.values_list("map", flat=True)
-        maps = Map.objects.filter(pk__in=map_ids)
-        map_items = natsorted(
-            [{"id": i[0], "label": i[1]} for i in maps.values_list("identifier", "title")],
-            key=lambda k: k["label"],
-        )
-
-        filter_items = {
-            "types": type_items,
-            "users": user_items,
-            "maps": map_items,
-        }
+        filter_items = {}
+        if pagination.facets:
+            filter_items = get_filter_items("sessions", queryset, get_session_filter_items)
+
+        if pagination.cursor is not None:
+            page = paginate_by_keyset(
+                queryset, ["-date_created", "-pk"], pagination.cursor, pagination.limit
+            )
+            page["count"] = get_count(queryset) if pagination.count else None
+            page["filter_items"] = filter_items
+            return page
 
         offset = pagination.offset
         return {
             "items": queryset[offset : offset + pagination.limit],
-            "count": queryset.count(),
+            "count": get_count(queryset),
             "filter_items": filter_items,
         }
 
@@ -70,6 +253,8 @@ class MapPagination(PaginationBase):
     class Input(Schema):
         offset: int = 0
         limit: int = 10
+        ## set to false to skip the filter items, e.g. when only flipping pages
+        facets: bool = True
 
     class Output(Schema):
         items: List[Any]
@@ -77,29 +262,14 @@ class MapPagination(PaginationBase):
         filter_items: dict
 
     def paginate_queryset(self, queryset, pagination: Input, **params):
-        place_ids = set(queryset.values_list("locales", flat=True))
-        places = Place.objects.filter(pk__in=place_ids)
-        place_items = natsorted(
-            [{"id": i.slug, "label": i.display_name} for i in places],
-            key=lambda k: k["id"],
-        )
-
-        user_ids = set(queryset.values_list("loaded_by", flat=True))
-        users = User.objects.filter(pk__in=user_ids)
-        user_items = natsorted(
-            [{"id": i.username, "label": i.username} for i in users],
-            key=lambda k: k["id"],
-        )
-
-        filter_items = {
-            "places": place_items,
-            "users": user_items,
-        }
+        filter_items = {}
+        if pagination.facets:
+            filter_items = get_filter_items("maps", queryset, get_map_filter_items)
 
         offset = pagination.offset
         return {
             "items": queryset[offset : offset + pagination.limit],
-            "count": queryset.count(),
+            "count": get_count(queryset),
             "filter_items": filter_items,
         }
 
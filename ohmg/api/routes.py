@@ -1,18 +1,26 @@
 import logging
+from datetime import datetime
 from typing import List
 
 from django.conf import settings
-from django.contrib.gis.geos import Polygon
-from django.db.models import F, Q
+from django.db.models import FloatField, OuterRef, Q, Subquery
+from django.http import HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from ninja import NinjaAPI, Query
+from ninja.errors import HttpError
 from ninja.pagination import paginate
 from ninja.security import APIKeyHeader
 
-from ohmg.accounts.models import (
-    APIKey,
-    User,
+from ohmg.accounts.api_keys import (
+    ACTIVE,
+    UNKNOWN,
+    get_key_status,
+    record_key_use,
 )
+from ohmg.accounts.models import User
+from ohmg.conf.http import conditional_response
+from ohmg.conf.renderers import FastJSONRenderer, FastJsonResponse
+from ohmg.core.exporters.ndjson import iter_layer_records
 from ohmg.core.models import (
     Document,
     Layer,
@@ -25,6 +33,8 @@ from ohmg.georeference.models import (
     SessionBase,
     SessionLock,
 )
+from ohmg.georeference.sessions import prefetch_locks
+from ohmg.places.cache import get_payload_versions, get_place_json, get_places_geojson_payload
 from ohmg.places.models import Place
 
 from .filters import (
@@ -33,16 +43,21 @@ from .filters import (
     FilterJobSchema,
     FilterRegionSchema,
     FilterSessionSchema,
+    filter_by_location,
+    limit_location_results,
+    set_location_result_headers,
 )
 from .paginators import (
+    KeysetPagination,
     MapPagination,
     ProfilePagination,
     SessionPagination,
 )
 from .schemas import (
+    DocumentListSchema,
     DocumentSchema,
     JobSchema,
-    LayerSchema,
+    LayerListSchema,
     LayerSetSchema,
     MapFullSchema,
     MapListSchema2,
@@ -52,6 +67,9 @@ from .schemas import (
     SessionLockSchema,
     SessionSchema,
     UserSchema,
+    prefetch_layers,
+    prefetch_layersets,
+    serialize_sparse,
 )
 
 logger = logging.getLogger(__name__)
@@ -63,16 +81,18 @@ class APIKeyAuth(APIKeyHeader):
     def authenticate(self, request, key):
         if key == settings.OHMG_API_KEY:
             return key
-        elif key in APIKey.objects.all().values_list("value", flat=True):
-            APIKey.objects.get(value=key).increment_count()
-            if key in APIKey.objects.filter(active=True).values_list("value", flat=True):
-                return key
+        status, pk = get_key_status(key)
+        if status != UNKNOWN:
+            record_key_use(pk)
+        if status == ACTIVE:
+            return key
 
 
 # going to be useful eventually for Geo support
 # https://github.com/vitalik/django-ninja/issues/335
 beta2 = NinjaAPI(
     auth=APIKeyAuth(),
+    renderer=FastJSONRenderer(),
     title="OldInsuranceMaps.net API",
     version="beta2",
     description="An API for accessing content on OldInsuranceMaps.net.",
@@ -80,7 +100,7 @@ beta2 = NinjaAPI(
 
 
 @beta2.get("jobs/", response=List[JobSchema], url_name="job_list")
-@paginate
+@paginate(KeysetPagination, ordering=["-date_created", "-pk"])
 def list_jobs(request, filters: FilterJobSchema = Query(...)):
     queryset = Job.objects.all().order_by("-date_queued")
     queryset = filters.filter(queryset)
@@ -143,8 +163,8 @@ def list_profiles(
 
 
 @beta2.get("map/", response=MapFullSchema, url_name="map")
-def get_map(request, map: str):
-    return get_object_or_404(Map, pk=map)
+def get_map(request, map: str, fields: str = None, exclude: str = None):
+    return serialize_sparse(MapFullSchema, get_object_or_404(Map, pk=map), fields, exclude)
 
 
 @beta2.get("maps2/", response=List[MapListSchema2], url_name="maps_list2")
@@ -157,6 +177,10 @@ def list_maps2(
     loaded_by: str = "",
     sort: str = "",
     sortby: str = "",
+    bbox: str = None,
+    intersects: str = None,
+    near: str = None,
+    radius: float = 1000,
 ):
     if loaded:
         maps = Map.objects.filter(load_date__isnull=False)
@@ -171,11 +195,27 @@ def list_maps2(
             maps = maps.filter(locales__in=place_ids)
         else:
             maps = maps.filter(locales__slug__exact=place)
+    spatial = bbox or intersects or near
+    if spatial:
+        ## rank each map by its best matching layerset
+        layersets = filter_by_location(
+            LayerSet.objects.filter(map_id=OuterRef("pk")),
+            bbox=bbox,
+            intersects=intersects,
+            near=near,
+            radius=radius,
+        )
+        rank = "distance" if near else "overlap"
+        maps = maps.annotate(
+            spatial_rank=Subquery(layersets.values(rank)[:1], output_field=FloatField())
+        ).filter(spatial_rank__isnull=False)
     if sortby:
         if sortby == "loaded_by":
             sortby = "loaded_by__username"
         sort_arg = sortby if sort == "asc" else f"-{sortby}"
         queryset = maps.order_by(sort_arg)
+    elif spatial:
+        queryset = maps.order_by("spatial_rank" if near else "-spatial_rank")
     else:
         queryset = maps.order_by("title")
     return queryset
@@ -187,20 +227,52 @@ def get_layerset(
     map: str,
     category: str,
 ):
-    return LayerSet.objects.get(category__slug=category, map_id=map)
+    layerset = get_object_or_404(LayerSet, category__slug=category, map_id=map)
+    return prefetch_layersets([layerset])[0]
 
 
 @beta2.get("layersets/", response=List[LayerSetSchema], url_name="layersets")
 def get_layersets(
     request,
-    map: str,
+    response: HttpResponse,
+    map: str = None,
+    category: str = None,
+    bbox: str = None,
+    intersects: str = None,
+    near: str = None,
+    radius: float = 1000,
+    limit: int = None,
+    offset: int = 0,
+    fields: str = None,
+    exclude: str = None,
 ):
-    return LayerSet.objects.filter(map_id=map)
+    """Without a map, location queries return at most settings.SPATIAL_QUERY_MAX_RESULTS
+    layersets. Use limit and offset to page through them, the X-Total-Count and Link
+    headers give the number of matches and the next page."""
+    if not (map or bbox or intersects or near):
+        raise HttpError(400, "one of map, bbox, intersects, or near is required")
+    layersets = LayerSet.objects.all()
+    if map:
+        layersets = layersets.filter(map_id=map)
+    if category:
+        layersets = layersets.filter(category__slug=category)
+    layersets = filter_by_location(
+        layersets, bbox=bbox, intersects=intersects, near=near, radius=radius
+    )
+    total = None
+    if not map:
+        layersets, total = limit_location_results(layersets, limit, offset)
+    result = serialize_sparse(LayerSetSchema, prefetch_layersets(layersets), fields, exclude)
+    if total is not None:
+        headers_on = result if isinstance(result, HttpResponse) else response
+        set_location_result_headers(request, headers_on, total, offset, len(layersets))
+    return result
 
 
 @beta2.get("place/", response=PlaceFullSchema, url_name="place")
 def place(request, slug: str):
-    return get_object_or_404(Place.objects.prefetch_related(), slug=slug)
+    ## the cached payload is already a PlaceFullSchema serialization
+    return FastJsonResponse(get_place_json(get_object_or_404(Place, slug=slug)))
 
 
 @beta2.get("places/", response=List[PlaceSchema], url_name="place_list")
@@ -213,53 +285,12 @@ def list_places(request):
 def get_places_geojson(request):
     """Generate geojson for all places with their maps."""
 
-    place_dict = {}
-    for ls in (
-        LayerSet.objects.filter(category__slug="main-content")
-        .prefetch_related()
-        .annotate(
-            locale=F("map__locales"),
-            locale_name=F("map__locales__display_name"),
-            locale_slug=F("map__locales__slug"),
-            map_year=F("map__year"),
-            map_volume_number=F("map__volume_number"),
-        )
-    ):
-        if ls.locale and ls.extent:
-            place_entry = place_dict.get(
-                ls.locale_slug,
-                {
-                    "type": "Feature",
-                    "geometry": {
-                        "type": "Point",
-                        "coordinates": Polygon().from_bbox(ls.extent).centroid.coords,
-                    },
-                    "properties": {
-                        "volumes": [],
-                        "place": {
-                            "url": f"/viewer/{ls.locale_slug}",
-                            "display_name": ls.locale_name,
-                        },
-                    },
-                },
-            )
-            year_vol = (
-                f"{ls.map_year} vol. {ls.map_volume_number}"
-                if ls.map_volume_number
-                else ls.map_year
-            )
-            place_entry["properties"]["volumes"].append(
-                {
-                    "year": year_vol,
-                    "url": f"/map/{ls.map_id}",
-                }
-            )
-            place_dict[ls.locale_slug] = place_entry
-    geojson = {
-        "type": "FeatureCollection",
-        "features": list(place_dict.values()),
-    }
-    return geojson
+    versions = get_payload_versions()
+    return conditional_response(
+        request,
+        lambda: FastJsonResponse(get_places_geojson_payload(versions)),
+        versions,
+    )
 
 
 ## DOCUMENT ROUTES
@@ -268,15 +299,20 @@ def document(request, id: int):
     return get_object_or_404(Document.objects.prefetch_related(), pk=id)
 
 
-@beta2.get("documents/", response=List[DocumentSchema], url_name="documents")
-def documents(request, filters: FilterDocumentSchema = Query(...)):
+@beta2.get("documents/", response=List[DocumentListSchema], url_name="documents")
+def documents(
+    request,
+    filters: FilterDocumentSchema = Query(...),
+    fields: str = None,
+    exclude: str = None,
+):
     queryset = Document.objects.all().prefetch_related()
     queryset = filters.filter(queryset)
-    return queryset
+    return serialize_sparse(DocumentListSchema, prefetch_locks(queryset), fields, exclude)
 
 
 @beta2.get("documents/all", response=List[DocumentSchema], url_name="documents")
-@paginate
+@paginate(KeysetPagination, ordering=["pk"])
 def documents_all(request, sort: str = None, filters: FilterAllDocumentsSchema = Query(...)):
     """Full paginated query for all documents in the database."""
     queryset = Document.objects.all().prefetch_related().order_by("map__title", "page_number")
@@ -299,15 +335,58 @@ def regions(request, filters: FilterRegionSchema = Query(...)):
     return queryset
 
 
-@beta2.get("layers/", response=List[LayerSchema], url_name="layers")
-def layer(request, map: str):
-    return Layer.objects.filter(region__document__map_id=map)
+@beta2.get("layers/", response=List[LayerListSchema], url_name="layers")
+def layer(
+    request,
+    response: HttpResponse,
+    map: str = None,
+    bbox: str = None,
+    intersects: str = None,
+    near: str = None,
+    radius: float = 1000,
+    limit: int = None,
+    offset: int = 0,
+    fields: str = None,
+    exclude: str = None,
+):
+    """Without a map, location queries return at most settings.SPATIAL_QUERY_MAX_RESULTS
+    layers. Use limit and offset to page through them, the X-Total-Count and Link
+    headers give the number of matches and the next page."""
+    if not (map or bbox or intersects or near):
+        raise HttpError(400, "one of map, bbox, intersects, or near is required")
+    layers = Layer.objects.all()
+    if map:
+        layers = layers.filter(region__document__map_id=map)
+    layers = filter_by_location(layers, bbox=bbox, intersects=intersects, near=near, radius=radius)
+    layers = prefetch_layers(layers)
+    total = None
+    if not map:
+        layers, total = limit_location_results(layers, limit, offset)
+    layers = prefetch_locks(layers)
+    result = serialize_sparse(LayerListSchema, layers, fields, exclude)
+    if total is not None:
+        headers_on = result if isinstance(result, HttpResponse) else response
+        set_location_result_headers(request, headers_on, total, offset, len(layers))
+    return result
+
+
+@beta2.get("layers/export/", url_name="layers_export")
+def export_layers(request, map: str = None, modified_since: datetime = None):
+    """Stream every layer (or every layer in a map) as NDJSON, one JSON object per line
+    with the layer's GCPs, transformation, mask, and file urls. Pass modified_since for
+    incremental syncs."""
+    response = StreamingHttpResponse(
+        iter_layer_records(modified_since=modified_since, map_id=map),
+        content_type="application/x-ndjson",
+    )
+    response["Content-Disposition"] = 'attachment; filename="layers.ndjson"'
+    return response
 
 
 ## SESSION LOCKS
 @beta2.get("session-locks/", response=List[SessionLockSchema], url_name="session_locks")
 def session_locks(request, map: str = None):
-    locks = SessionLock.objects.all().prefetch_related()
+    locks = SessionLock.objects.all().select_related("user", "target_type")
     if map:
-        locks = [i for i in locks if i.target.map.pk == map]
+        locks = locks.filter(session__map_id=map)
     return locks
@@ -1,16 +1,22 @@
 import json
 import logging
 from datetime import datetime
+from functools import lru_cache
 from typing import TYPE_CHECKING, Any, List, Literal, Optional
 
 import humanize
 from avatar.templatetags.avatar_tags import avatar_url
+from django.contrib.contenttypes.models import ContentType
+from django.db.models import Prefetch, QuerySet, prefetch_related_objects
 from django.urls import reverse
 from natsort import natsorted
 from ninja import (
     Schema,
 )
+from ninja.errors import HttpError
+from pydantic import create_model
 
+from ohmg.conf.renderers import FastJsonResponse
 from ohmg.core.models import (
     Document,
     Layer,
@@ -18,7 +24,9 @@ from ohmg.core.models import (
 )
 from ohmg.core.storages import get_file_url
 from ohmg.georeference.models import (
+    GCP,
     GeorefSession,
+    Job,
     PrepSession,
     SessionLock,
 )
@@ -29,6 +37,111 @@ if TYPE_CHECKING:
 logger = logging.getLogger(__name__)
 
 
+def prefetch_regions(queryset):
+    """Add everything RegionSchema needs to a Region queryset, so that serializing it
+    takes a constant number of queries."""
+    return queryset.select_related("document", "created_by")
+
+
+def prefetch_layers(queryset):
+    """Add everything LayerSchema needs to a Layer queryset, including the GCPs (and
+    their users) for each layer's region, so that serializing it takes a constant number
+    of queries."""
+    return queryset.select_related(
+        "region",
+        "region__gcpgroup",
+        "created_by",
+        "last_updated_by",
+    ).prefetch_related(
+        Prefetch(
+            "region__gcpgroup__gcp_set",
+            queryset=GCP.objects.select_related("last_modified_by"),
+        )
+    )
+
+
+def prefetch_layersets(layersets) -> list:
+    """Preload everything LayerSetSchema needs for these LayerSets: categories, maps,
+    layers, and the latest mosaic jobs for each. Returns a list of the LayerSets."""
+
+    layersets = [i for i in layersets if i is not None]
+    if not layersets:
+        return layersets
+
+    prefetch_related_objects(
+        layersets,
+        "category",
+        "map",
+        Prefetch("layer_set", queryset=Layer.objects.select_related("region")),
+    )
+
+    operations = ["layerset_to_cog", "layerset_to_xyz"]
+    jobs = Job.objects.filter(
+        target_type=ContentType.objects.get_for_model(layersets[0]),
+        target_id__in=[i.pk for i in layersets],
+        operation__in=operations,
+    ).order_by("-date_queued")
+    latest = {}
+    for job in jobs:
+        latest.setdefault((job.target_id, job.operation), job)
+
+    for layerset in layersets:
+        layerset._latest_jobs = {}
+        for operation in operations:
+            job = latest.get((layerset.pk, operation))
+            if job:
+                job.target = layerset
+            layerset._latest_jobs[operation] = job
+
+    return layersets
+
+
+@lru_cache(maxsize=None)
+def _make_sparse_schema(schema, names: tuple):
+    definitions = {}
+    for name in names:
+        field = schema.__fields__[name]
+        annotation = Optional[field.outer_type_] if field.allow_none else field.outer_type_
+        definitions[name] = (annotation, ... if field.required else field.default)
+    sparse = create_model(f"{schema.__name__}Sparse", __base__=Schema, **definitions)
+    ## only the resolvers of the included fields are kept, so the others never run
+    sparse._ninja_resolvers = {k: v for k, v in schema._ninja_resolvers.items() if k in definitions}
+    return sparse
+
+
+def sparse_schema(schema, fields: str = None, exclude: str = None):
+    """Returns a version of schema with only the fields named in fields, and/or without
+    those named in exclude (both are comma-separated lists). The resolvers for fields
+    that are left out are never called. Returns schema itself if neither is given."""
+    if not fields and not exclude:
+        return schema
+
+    names = list(schema.__fields__.keys())
+    requested = [i.strip() for i in fields.split(",") if i.strip()] if fields else names
+    excluded = [i.strip() for i in exclude.split(",") if i.strip()] if exclude else []
+    unknown = set(requested + excluded) - set(names)
+    if unknown:
+        raise HttpError(
+            400, f"unknown field(s): {', '.join(sorted(unknown))}. valid: {', '.join(names)}"
+        )
+    return _make_sparse_schema(
+        schema, tuple(i for i in names if i in requested and i not in excluded)
+    )
+
+
+def serialize_sparse(schema, obj, fields: str = None, exclude: str = None):
+    """If fields or exclude is given, serialize obj (or a list of objs) with a sparse
+    version of schema and return it as a JsonResponse, which routes can return in place
+    of their usual response. Otherwise, obj is returned as-is for the route's response
+    schema to serialize."""
+    if not fields and not exclude:
+        return obj
+    sparse = sparse_schema(schema, fields, exclude)
+    if isinstance(obj, (list, QuerySet)):
+        return FastJsonResponse([sparse.from_orm(i).dict() for i in obj], safe=False)
+    return FastJsonResponse(sparse.from_orm(obj).dict())
+
+
 def _datefield_to_timestamp(obj, field: str) -> float | None:
     try:
         return getattr(obj, field).timestamp()
@@ -509,7 +622,7 @@ class LayerSetSchema(Schema):
 
     @staticmethod
     def resolve_layers_masked_ct(obj):
-        return obj.get_layers().filter(mask__isnull=False).count()
+        return len([i for i in obj.get_layers() if i.mask])
 
     @staticmethod
     def resolve_name(obj):
@@ -632,6 +745,20 @@ class SessionLockSchema(Schema):
         return obj.target_type.model
 
 
+class DocumentListSchema(DocumentSchema):
+    """DocumentSchema plus the current lock, for list endpoints. Pass the documents
+    through prefetch_locks() first so the locks are looked up in a single query."""
+
+    lock: Optional[SessionLockSchema]
+
+
+class LayerListSchema(LayerSchema):
+    """LayerSchema plus the current lock, for list endpoints. Pass the layers
+    through prefetch_locks() first so the locks are looked up in a single query."""
+
+    lock: Optional[SessionLockSchema]
+
+
 class MapFullSchema(Schema):
     identifier: str
     title: str
@@ -702,12 +829,9 @@ class MapFullSchema(Schema):
 
     @staticmethod
     def resolve_locks(obj):
-        locks = [
-            i
-            for i in SessionLock.objects.all().prefetch_related()
-            if i.target and i.target.map.pk == obj.pk
-        ]
-        return locks
+        return SessionLock.objects.filter(session__map_id=obj.pk).select_related(
+            "user", "target_type"
+        )
 
     @staticmethod
     def resolve_documents(obj):
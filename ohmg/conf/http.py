@@ -1,14 +1,19 @@
+import hashlib
 import json
 import re
+from calendar import timegm
 from http import HTTPStatus
 
 from django.conf import settings
-from django.http import JsonResponse
 from django.middleware import csrf
 from django.urls import reverse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
 
 from ohmg.api.schemas import UserSchema
 
+from .renderers import FastJsonResponse
+
 ## ~~ CONTEXT GENERATION
 
 
@@ -77,7 +82,7 @@ def generate_ohmg_context(request) -> dict:
 ## ~~ JSON RESPONSES
 
 
-class JsonResponseNotFound(JsonResponse):
+class JsonResponseNotFound(FastJsonResponse):
     def __init__(self, message="object not found"):
         self.status_code = HTTPStatus.NOT_FOUND
         super().__init__(
@@ -88,7 +93,7 @@ class JsonResponseNotFound(JsonResponse):
         )
 
 
-class JsonResponseUnauthorized(JsonResponse):
+class JsonResponseUnauthorized(FastJsonResponse):
     def __init__(self, message="unauthorized"):
         self.status_code = HTTPStatus.UNAUTHORIZED
         super().__init__(
@@ -99,7 +104,7 @@ class JsonResponseUnauthorized(JsonResponse):
         )
 
 
-class JsonResponseBadRequest(JsonResponse):
+class JsonResponseBadRequest(FastJsonResponse):
     def __init__(self, message="bad request"):
         self.status_code = HTTPStatus.BAD_REQUEST
         super().__init__(
@@ -110,7 +115,7 @@ class JsonResponseBadRequest(JsonResponse):
         )
 
 
-class JsonResponseFail(JsonResponse):
+class JsonResponseFail(FastJsonResponse):
     def __init__(self, message="fail", payload={}):
         super().__init__(
             {
@@ -121,7 +126,7 @@ class JsonResponseFail(JsonResponse):
         )
 
 
-class JsonResponseSuccess(JsonResponse):
+class JsonResponseSuccess(FastJsonResponse):
     def __init__(self, message="ok", payload={}):
         super().__init__(
             {
@@ -132,6 +137,43 @@ class JsonResponseSuccess(JsonResponse):
         )
 
 
+## ~~ CONDITIONAL GET
+
+
+def make_etag(*parts) -> str:
+    """Returns a quoted ETag made from a hash of the str() of each part."""
+    content = "|".join(str(i) for i in parts)
+    return quote_etag(hashlib.md5(content.encode()).hexdigest())
+
+
+def conditional_response(request, build_response, etag_parts, last_modified=None, public=True):
+    """Returns a 304 Not Modified response if the request's If-None-Match (or
+    If-Modified-Since) header matches the validators, otherwise calls build_response().
+
+    etag_parts should cover everything the response content depends on, and be much
+    cheaper to get than the content itself. The ETag, Last-Modified, and Cache-Control
+    headers are set on both kinds of response. Use public=False for content that not
+    everyone can access, so that shared caches won't store it."""
+
+    etag = make_etag(*etag_parts)
+    timestamp = timegm(last_modified.utctimetuple()) if last_modified else None
+
+    response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+    if response is None:
+        response = build_response()
+    if response.status_code not in (200, 304):
+        return response
+
+    response.headers["ETag"] = etag
+    if timestamp is not None:
+        response.headers["Last-Modified"] = http_date(timestamp)
+    if public:
+        patch_cache_control(response, public=True, max_age=settings.CONDITIONAL_GET_MAX_AGE)
+    else:
+        patch_cache_control(response, private=True, max_age=0, must_revalidate=True)
+    return response
+
+
 ## ~~ DECORATORS
 
 
@@ -1,7 +1,17 @@
+import re
 from fnmatch import fnmatch
 
 from django.conf import settings
 from django.contrib.auth.views import redirect_to_login
+from django.middleware.gzip import GZipMiddleware
+from django.utils.cache import patch_vary_headers
+
+from ohmg.core.lookups import coalesce_item_lookups
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
 
 class LoginRequiredMiddleware:
@@ -53,5 +63,55 @@ class CORSMiddleware(object):
 
         if any([fnmatch(request.path, i) for i in settings.CORS_WHITELIST]):
             response["Access-Control-Allow-Origin"] = "*"
+            ## lets browser clients page through location queries (see api.filters)
+            response["Access-Control-Expose-Headers"] = "X-Total-Count, Link"
+
+        return response
+
+
+class CoalesceItemLookupsMiddleware:
+    """Rebuild the item lookup of each map that is changed during a request only once,
+    no matter how many of its items were saved. See ohmg.core.lookups."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with coalesce_item_lookups():
+            return self.get_response(request)
+
+
+class CompressJsonMiddleware(GZipMiddleware):
+    """Compresses JSON responses with brotli (if it is installed and the client accepts
+    it) or gzip. Other responses are left alone: HTML pages contain CSRF tokens, which
+    compression would expose to BREACH attacks."""
+
+    content_types = ("application/json", "application/geo+json", "application/x-ndjson")
+    re_accepts_br = re.compile(r"\bbr\b")
+
+    def process_response(self, request, response):
+        if not response.get("Content-Type", "").startswith(self.content_types):
+            return response
+
+        accept = request.META.get("HTTP_ACCEPT_ENCODING", "")
+        if (
+            brotli is None
+            or response.streaming
+            or response.has_header("Content-Encoding")
+            or len(response.content) < 200
+            or not self.re_accepts_br.search(accept)
+        ):
+            return super().process_response(request, response)
 
+        patch_vary_headers(response, ("Accept-Encoding",))
+        compressed = brotli.compress(response.content, quality=5)
+        if len(compressed) >= len(response.content):
+            return response
+        response.content = compressed
+        response.headers["Content-Length"] = str(len(compressed))
+        ## the content has changed, so a strong ETag is no longer valid
+        etag = response.get("ETag")
+        if etag and etag.startswith('"'):
+            response.headers["ETag"] = "W/" + etag
+        response.headers["Content-Encoding"] = "br"
         return response
@@ -0,0 +1,54 @@
+"""
+JSON encoding for API and view responses.
+
+If orjson is installed (pip install ohmg[speedups]) and settings.FAST_JSON is True,
+it is used in place of the stdlib json module, which is several times faster on
+large payloads like item lookups, multimasks, and the places geojson. Anything that
+orjson can't encode natively, including datetimes (so that their format matches
+Django's), is passed on to the usual Django/ninja encoder.
+"""
+
+import json
+from typing import Any
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse
+from ninja.renderers import BaseRenderer
+from ninja.responses import NinjaJSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dumps(data: Any, encoder=DjangoJSONEncoder) -> bytes:
+    if orjson is not None and settings.FAST_JSON:
+        return orjson.dumps(
+            data,
+            default=encoder().default,
+            option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS,
+        )
+    return json.dumps(data, cls=encoder).encode()
+
+
+class FastJsonResponse(HttpResponse):
+    """Same as Django's JsonResponse, but encodes the data with dumps()."""
+
+    def __init__(self, data, encoder=DjangoJSONEncoder, safe=True, **kwargs):
+        if safe and not isinstance(data, dict):
+            raise TypeError(
+                "In order to allow non-dict objects to be serialized set the safe parameter to False."
+            )
+        kwargs.setdefault("content_type", "application/json")
+        super().__init__(content=dumps(data, encoder=encoder), **kwargs)
+
+
+class FastJSONRenderer(BaseRenderer):
+    """Renderer for NinjaAPI that encodes with dumps()."""
+
+    media_type = "application/json"
+
+    def render(self, request, data, *, response_status):
+        return dumps(data, encoder=NinjaJSONEncoder)
@@ -144,6 +144,17 @@ DATABASES = {
     }
 }
 
+# cache shared by every web server process, Celery worker, and management command.
+# the place, geojson, and footprint payload versions live here, so a per-process
+# cache (e.g. locmem) would let each process serve its own stale copy. the default
+# is a table in the main database, which is created by the places migrations.
+CACHES = {
+    "default": {
+        "BACKEND": os.getenv("CACHE_BACKEND", "django.core.cache.backends.db.DatabaseCache"),
+        "LOCATION": os.getenv("CACHE_LOCATION", "ohmg_cache"),
+    }
+}
+
 
 DEFAULT_AUTO_FIELD = "django.db.models.AutoField"
 DEFAULT_FILE_STORAGE = "ohmg.core.storages.OverwriteStorage"
@@ -237,6 +248,7 @@ except ValueError:
 ADMIN_EMAIL = os.getenv("ADMIN_EMAIL", "admin@localhost")
 
 MIDDLEWARE = (
+    "ohmg.conf.middleware.CompressJsonMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
@@ -249,6 +261,7 @@ MIDDLEWARE = (
     "django.contrib.redirects.middleware.RedirectFallbackMiddleware",
     "allauth.account.middleware.AccountMiddleware",
     "ohmg.conf.middleware.CORSMiddleware",
+    "ohmg.conf.middleware.CoalesceItemLookupsMiddleware",
 )
 
 CORS_WHITELIST = (
@@ -305,6 +318,61 @@ SWAP_COORDINATE_ORDER = ast.literal_eval(os.getenv("SWAP_COORDINATE_ORDER", "Fal
 
 MAX_CONCURRENT_MOSAIC_JOBS = int(os.getenv("MAX_CONCURRENT_MOSAIC_JOBS", 1))
 
+# number of document source files that are downloaded at once when loading a map,
+# and the maximum number of simultaneous connections to any single upstream host
+DOCUMENT_LOAD_MAX_WORKERS = int(os.getenv("DOCUMENT_LOAD_MAX_WORKERS", 4))
+DOWNLOAD_MAX_CONNECTIONS_PER_HOST = int(os.getenv("DOWNLOAD_MAX_CONNECTIONS_PER_HOST", 2))
+
+# if > 0, Map item lookup rebuilds are run by a Celery task this many seconds after
+# the first change, instead of synchronously at the end of the request or task
+ITEM_LOOKUP_DEBOUNCE = int(os.getenv("ITEM_LOOKUP_DEBOUNCE", 0))
+# max number of changed items for which a lookup is updated in place, not fully rebuilt
+ITEM_LOOKUP_INCREMENTAL_MAX = int(os.getenv("ITEM_LOOKUP_INCREMENTAL_MAX", 50))
+
+# number of rows in a bulk map import file that are parsed (fetched from LOC, etc.) at once
+# (requests to any single host are still capped by DOWNLOAD_MAX_CONNECTIONS_PER_HOST)
+BULK_IMPORT_MAX_WORKERS = int(os.getenv("BULK_IMPORT_MAX_WORKERS", 4))
+
+# seconds before a cached API response (LOC, epsg.io, etc.) is revalidated upstream,
+# 0 means cached responses never go stale. write-behind stores new responses
+# on a background thread instead of blocking the request.
+RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", 0))
+RESPONSE_CACHE_WRITE_BEHIND = ast.literal_eval(os.getenv("RESPONSE_CACHE_WRITE_BEHIND", "False"))
+
+# seconds that the IIIF selector coordinates of a layer's mask are cached. entries are
+# keyed on the mask and GCPs, so changes to either are picked up right away
+IIIF_CACHE_TIMEOUT = int(os.getenv("IIIF_CACHE_TIMEOUT", 60 * 60 * 24 * 7))
+
+# seconds that clients and shared caches may reuse derivative, IIIF, Atlascope and
+# places geojson responses before checking their ETag again
+CONDITIONAL_GET_MAX_AGE = int(os.getenv("CONDITIONAL_GET_MAX_AGE", 60))
+
+# use orjson (if installed) to encode API and other JSON responses
+FAST_JSON = ast.literal_eval(os.getenv("FAST_JSON", "True"))
+
+# seconds that the status of an API key is cached for, and the seconds between writes
+# of the accumulated API key request counts to the database
+API_KEY_CACHE_TTL = int(os.getenv("API_KEY_CACHE_TTL", 60))
+API_KEY_COUNT_FLUSH_INTERVAL = int(os.getenv("API_KEY_COUNT_FLUSH_INTERVAL", 60))
+
+# seconds that the filter options returned alongside paginated sessions and maps are
+# cached for, and the table size above which unfiltered lists use an estimated count
+PAGINATION_FACET_CACHE_TTL = int(os.getenv("PAGINATION_FACET_CACHE_TTL", 60))
+PAGINATION_ESTIMATED_COUNT_MIN = int(os.getenv("PAGINATION_ESTIMATED_COUNT_MIN", 100000))
+
+# most layers or layersets that a bbox/intersects/near query without a map returns at
+# once, larger result sets are paged with limit and offset
+SPATIAL_QUERY_MAX_RESULTS = int(os.getenv("SPATIAL_QUERY_MAX_RESULTS", 100))
+
+# seconds that place page payloads (select lists, breadcrumbs, etc.) are cached. entries
+# are also invalidated whenever places, place counts, or the maps attached to them change.
+PLACE_CACHE_TIMEOUT = int(os.getenv("PLACE_CACHE_TIMEOUT", 60 * 60 * 24))
+
+# if > 0, the places geojson is rebuilt by a Celery task this many seconds after a
+# layerset or map changes, instead of by the next request that asks for it. the task
+# fills the shared cache (see CACHES), so the result is used by every web process.
+PLACES_GEOJSON_REBUILD_DELAY = int(os.getenv("PLACES_GEOJSON_REBUILD_DELAY", 0))
+
 # CONFIGURE CELERY
 CELERY_BROKER_URL = os.getenv("BROKER_URL")
 CELERY_RESULT_BACKEND = "rpc://"
@@ -326,6 +394,10 @@ CELERY_TASK_ROUTES = {
     "ohmg.georeference.tasks.run_georeference_session": {"queue": "main"},
     "ohmg.core.tasks.load_map_documents_as_task": {"queue": "main"},
     "ohmg.core.tasks.load_document_file_as_task": {"queue": "main"},
+    "ohmg.core.tasks.update_item_lookup_as_task": {"queue": "background"},
+    "ohmg.places.tasks.rebuild_places_geojson_as_task": {"queue": "background"},
+    "ohmg.accounts.tasks.write_api_key_counts_as_task": {"queue": "background"},
+    "ohmg.accounts.tasks.reconcile_user_counts": {"queue": "background"},
     "ohmg.georeference.tasks.delete_stale_sessions": {"queue": "background"},
     "ohmg.georeference.tasks.delete_preview_vrts": {"queue": "background"},
     "ohmg.georeference.tasks.cleanup_existing_tileset": {"queue": "background"},
@@ -344,6 +416,10 @@ CELERY_BEAT_SCHEDULE = {
         "task": "ohmg.georeference.tasks.run_queued_mosaic_jobs",
         "schedule": 15.0,
     },
+    "reconcile_user_counts": {
+        "task": "ohmg.accounts.tasks.reconcile_user_counts",
+        "schedule": 60.0 * 60 * 24,
+    },
 }
 
 # note: this is app_label.ModelClass,
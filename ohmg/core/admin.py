@@ -71,6 +71,7 @@ class LayerSetAdmin(admin.ModelAdmin):
         "layer_display_list",
         "extent",
         "multimask_extent",
+        "multimask_features",
         "xyz_tiles_url",
         "multimask_date",
     )
@@ -0,0 +1,44 @@
+import json
+from datetime import datetime
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Exists, OuterRef, Q
+
+from ohmg.api.schemas import LayerSchema, prefetch_layers
+from ohmg.georeference.models import GCP
+
+from ..models import Layer
+
+
+def iter_layer_records(modified_since: datetime = None, map_id: str = None, chunk_size: int = 500):
+    """Yields one JSON line per layer, holding its LayerSchema serialization (GCPs,
+    mask, file urls, etc.) along with its map, transformation, and GCP projection.
+    Layers are read through a server-side cursor, chunk_size at a time, so memory use
+    doesn't grow with the number of layers.
+
+    If modified_since is given, only layers that have been updated since then, or that
+    have GCPs that were modified since then, are included."""
+
+    layers = Layer.objects.all()
+    if map_id:
+        layers = layers.filter(region__document__map_id=map_id)
+    if modified_since:
+        gcps_modified = GCP.objects.filter(
+            gcp_group__region2=OuterRef("region"),
+            last_modified__gte=modified_since,
+        )
+        layers = layers.filter(Q(last_updated__gte=modified_since) | Exists(gcps_modified))
+    layers = prefetch_layers(layers).select_related("region__document").order_by("pk")
+
+    for layer in layers.iterator(chunk_size=chunk_size):
+        record = LayerSchema.from_orm(layer).dict()
+        gcpgroup = getattr(layer.region, "gcpgroup", None)
+        record.update(
+            {
+                "map": layer.region.document.map_id,
+                "transformation": gcpgroup.transformation if gcpgroup else None,
+                "gcps_epsg": gcpgroup.crs_epsg if gcpgroup else None,
+                "last_updated": layer.last_updated,
+            }
+        )
+        yield json.dumps(record, cls=DjangoJSONEncoder) + "\n"
@@ -2,10 +2,13 @@ import csv
 import importlib
 import json
 import logging
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from warnings import warn
 
 from django.conf import settings
+from django.db import connection, transaction
 
 from ohmg.places.models import Place
 
@@ -135,10 +138,14 @@ class BaseImporter:
             "This method must be implemented on each " "importer class that inherits from this one."
         )
 
-    def create_map(self) -> Map:
-        locale = None
+    def create_map(self, locale: Place = None) -> Map:
+        """Create a new Map from self.parsed_data. A locale that has already been
+        retrieved (e.g. during a bulk import) can be passed in to avoid looking it up again."""
+
         if "locale" in self.parsed_data:
-            locale = Place.objects.get(slug=self.parsed_data.pop("locale"))
+            locale_slug = self.parsed_data.pop("locale")
+            if locale is None:
+                locale = Place.objects.get(slug=locale_slug)
 
         if self.dry_run:
             print(json.dumps(self.parsed_data, indent=2))
@@ -165,8 +172,8 @@ class BaseImporter:
         map.update_place_counts()
         map.get_layerset("main-content", create=True)
 
+        ## this will also build the item lookup for the map
         map.create_documents()
-        map.update_item_lookup()
 
         return map
 
@@ -211,10 +218,97 @@ class BaseImporter:
             map = self.create_map()
             return map
 
-    def run_bulk_import(self, csv_file: str):
+    def _parse_row(self, row_number: int, item: dict) -> "BaseImporter":
+        """Parse a single bulk import row with a fresh importer instance, running the
+        checks that don't need the database. Runs in a worker thread."""
+
+        importer = self.__class__(
+            dry_run=self.dry_run,
+            verbose=self.verbose,
+            overwrite=self.overwrite,
+            skip_existing=self.skip_existing,
+        )
+        importer.row_number = row_number
+        try:
+            missing = importer.validate_input(**item)
+            if missing:
+                importer.errors.append(f"Import operation missing required arg(s): {missing}")
+                return importer
+            importer.input_data = item
+            importer.parse()
+            importer.check_document_sources()
+        except Exception as e:
+            importer.errors.append(f"Error parsing input: {e}")
+        finally:
+            ## parse() may have queried the database from this thread
+            connection.close()
+        return importer
+
+    def _check_bulk_rows(self, importers: list):
+        """Run the identifier and locale checks for all parsed rows at once, instead
+        of with one query per row, and flag identifiers or document paths that are
+        repeated across rows. Returns a lookup of Place objects by slug."""
+
+        identifiers = [i.parsed_data.get("identifier") for i in importers]
+        id_counts = Counter([i for i in identifiers if i])
+        existing = set(
+            Map.objects.filter(pk__in=id_counts.keys()).values_list("identifier", flat=True)
+        )
+
+        ## count each path once per row, so only repeats across rows are flagged here
+        ## (repeats within a row are caught by check_document_sources)
+        row_paths = [
+            set([s.get("path") for s in i.parsed_data.get("document_sources", []) if s.get("path")])
+            for i in importers
+        ]
+        path_counts = Counter([p for paths in row_paths for p in paths])
+
+        locale_slugs = set([i.parsed_data.get("locale") for i in importers])
+        locales = {}
+        for place in Place.objects.filter(slug__in=locale_slugs):
+            locales[place.slug] = None if place.slug in locales else place
+
+        for importer, paths in zip(importers, row_paths):
+            if importer.errors:
+                continue
+            for path in sorted([p for p in paths if path_counts[p] > 1]):
+                importer.errors.append(
+                    f"ERROR: Document path appears in more than one row of the file - {path}"
+                )
+
+            id = importer.parsed_data.get("identifier")
+            if not id:
+                importer.parsed_data["identifier"] = random_alnum().upper()
+            elif id_counts[id] > 1:
+                importer.errors.append(f"The identifier '{id}' appears more than once in the file.")
+            elif id in existing:
+                importer.map_exists = True
+                if not self.overwrite and not self.skip_existing:
+                    importer.errors.append(f"A map with the identifier '{id}' already exists.")
+
+            locale_slug = importer.parsed_data.get("locale")
+            if locale_slug not in locales:
+                importer.errors.append(f"Invalid place slug (doesn't exist): {locale_slug}.")
+            elif locales[locale_slug] is None:
+                importer.errors.append(
+                    f"Invalid place slug (multiple objects returned): {locale_slug}."
+                )
+
+            importer.check_parsed_data()
+
+        return locales
+
+    def run_bulk_import(self, csv_file: str, max_workers: int = None) -> list:
         """Wraps the main import function by feeding rows from a CSV into it.
         All values in a CSV row are passed to the importer, any irrelevant ones
-        will be ignored."""
+        will be ignored.
+
+        All rows are parsed concurrently (parsing usually means waiting on an external
+        API), and then validated together, before any maps are created. Each map is created
+        in its own transaction so one failure doesn't affect the rest of the file.
+
+        Returns a list of result dicts, one per row, with row, identifier, status
+        (created, skipped, invalid, failed, or dry-run), and errors."""
 
         with open(csv_file, "r", encoding="utf-8-sig") as o:
             reader = csv.DictReader(o)
@@ -225,8 +319,47 @@ class BaseImporter:
             ## for 'path' params, treat them as relative to the bulk CSV,
             ## and then resolve to absolute paths.
             if "path" in item:
-                item["path"] = str(Path(csv_parent, item["path"]))
-            self.run_import(**item)
+                item["path"] = str(Path(csv_parent, item["path"]).resolve())
+
+        max_workers = max_workers or settings.BULK_IMPORT_MAX_WORKERS
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            importers = list(executor.map(self._parse_row, range(1, len(items) + 1), items))
+
+        locales = self._check_bulk_rows(importers)
+
+        results = []
+        for importer in importers:
+            result = {
+                "row": importer.row_number,
+                "identifier": importer.parsed_data.get("identifier"),
+                "status": None,
+                "errors": importer.errors,
+            }
+            results.append(result)
+            if importer.errors:
+                result["status"] = "invalid"
+                for error in importer.errors:
+                    logger.error(f"row {importer.row_number}: {error}")
+                continue
+            if getattr(importer, "map_exists", False) and self.skip_existing:
+                logger.warning(f"a map with the id {result['identifier']} already exists, skipping")
+                result["status"] = "skipped"
+                continue
+            if self.dry_run:
+                importer.create_map()
+                result["status"] = "dry-run"
+                continue
+            try:
+                with transaction.atomic():
+                    locale = locales.get(importer.parsed_data.get("locale"))
+                    importer.create_map(locale=locale)
+                result["status"] = "created"
+            except Exception as e:
+                logger.error(f"row {importer.row_number}: {e}")
+                result["status"] = "failed"
+                result["errors"].append(str(e))
+
+        return results
 
 
 class DefaultImporter(BaseImporter):
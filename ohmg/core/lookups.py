@@ -0,0 +1,116 @@
+"""
+Coalesced rebuilding of Map.item_lookup.
+
+Every save of a Document, Region, or Layer asks for its map's item lookup to be
+rebuilt. Inside a coalesce_item_lookups() block (every web request and the session
+tasks are wrapped in one) those requests only mark the map as dirty, and each dirty
+map is rebuilt once when the outermost block exits, after the current transaction
+commits. If settings.ITEM_LOOKUP_DEBOUNCE is greater than 0, rebuilds are instead
+handed to a Celery task that runs after that many seconds, and further requests
+for the same map that arrive in the meantime are dropped.
+
+Requests identify which item changed, so a map with only a few changed items
+(up to settings.ITEM_LOOKUP_INCREMENTAL_MAX) gets an incremental update of just
+those items, see Map.update_item_lookup(). Debounced rebuilds are always full.
+"""
+
+import logging
+import threading
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+_state = threading.local()
+
+
+def _pending_key(map_id):
+    return f"item-lookup-pending-{map_id}"
+
+
+def rebuild_item_lookup(map_id, changed: dict = None):
+    from .models import Map
+
+    map = Map.objects.filter(pk=map_id).first()
+    if map is None:
+        logger.debug(f"map {map_id} no longer exists, skipping item lookup update")
+        return
+    if changed and sum(len(i) for i in changed.values()) > settings.ITEM_LOOKUP_INCREMENTAL_MAX:
+        changed = None
+    map.update_item_lookup(changed=changed)
+
+
+def _dispatch(dirty: dict):
+    for map_id, changed in sorted(dirty.items()):
+        if settings.ITEM_LOOKUP_DEBOUNCE > 0:
+            from .tasks import update_item_lookup_as_task
+
+            ## cache.add() only succeeds if no rebuild is already pending for this map
+            if cache.add(_pending_key(map_id), True, timeout=settings.ITEM_LOOKUP_DEBOUNCE * 2):
+                update_item_lookup_as_task.apply_async(
+                    (map_id,), countdown=settings.ITEM_LOOKUP_DEBOUNCE
+                )
+        else:
+            rebuild_item_lookup(map_id, changed=changed)
+
+
+def clear_pending(map_id):
+    """Called by the debounced task right before it rebuilds the lookup, so that any
+    change made during the rebuild will schedule another one."""
+    cache.delete(_pending_key(map_id))
+
+
+def request_item_lookup_update(map_id, kind: str = None, ids: list = None):
+    """Ask for the item lookup of this map to be updated. kind ("document", "region",
+    or "layer") and ids identify the items that changed; if they are omitted the whole
+    lookup is rebuilt. Deferred if called within a coalesce_item_lookups() block."""
+
+    if getattr(_state, "depth", 0) > 0:
+        dirty = _state.dirty
+    else:
+        dirty = {}
+
+    if kind is None:
+        dirty[map_id] = None
+    elif map_id not in dirty:
+        dirty[map_id] = {kind: set(ids)}
+    elif dirty[map_id] is not None:
+        dirty[map_id].setdefault(kind, set()).update(ids)
+
+    if getattr(_state, "depth", 0) == 0:
+        _dispatch(dirty)
+
+
+@contextmanager
+def coalesce_item_lookups():
+    """Within this block, item lookup updates are collected and each affected map is
+    updated only once on exit of the outermost block. Blocks can be nested."""
+
+    depth = getattr(_state, "depth", 0)
+    if depth == 0:
+        _state.dirty = {}
+    _state.depth = depth + 1
+    try:
+        yield
+    finally:
+        _state.depth -= 1
+        if _state.depth == 0:
+            dirty, _state.dirty = _state.dirty, {}
+            if dirty:
+                ## runs immediately if not in an atomic block, is discarded on rollback
+                transaction.on_commit(lambda: _dispatch(dirty))
+
+
+def coalesced(func):
+    """Decorator version of coalesce_item_lookups()."""
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        with coalesce_item_lookups():
+            return func(*args, **kwargs)
+
+    return wrapper
@@ -0,0 +1,75 @@
+import gzip
+import time
+
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+from ninja.responses import NinjaJSONEncoder
+
+from ohmg.api.schemas import MapFullSchema
+from ohmg.conf.renderers import dumps, orjson
+from ohmg.core.models import Map
+from ohmg.places.utils import generate_places_geojson
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def _time(func, number):
+    start = time.perf_counter()
+    for _ in range(number):
+        func()
+    return (time.perf_counter() - start) / number * 1000
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare JSON encoding time (with FAST_JSON off and on) and compressed sizes "
+        "for large API payloads, encoded the same way as API responses."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "-i",
+            "--identifier",
+            help="map to use for the item lookup payload, defaults to the one with most documents",
+        )
+        parser.add_argument(
+            "-n",
+            "--number",
+            type=int,
+            default=20,
+            help="number of times to encode each payload",
+        )
+
+    def handle(self, *args, **options):
+        if options["identifier"]:
+            map = Map.objects.get(pk=options["identifier"])
+        else:
+            map = Map.objects.order_by("-document_ct").first()
+
+        payloads = {"places geojson": generate_places_geojson()}
+        if map:
+            payloads[f"map {map.pk}"] = MapFullSchema.from_orm(map).dict()
+
+        def encode(data):
+            return dumps(data, encoder=NinjaJSONEncoder)
+
+        number = options["number"]
+        for name, data in payloads.items():
+            with override_settings(FAST_JSON=False):
+                content = encode(data)
+                json_ms = _time(lambda: encode(data), number)
+            print(f"{name}: {len(content):,} bytes")
+            print(f"  json:   {json_ms:.2f} ms")
+            if orjson is not None:
+                with override_settings(FAST_JSON=True):
+                    print(f"  orjson: {_time(lambda: encode(data), number):.2f} ms")
+            else:
+                print("  orjson: not installed")
+            print(f"  gzip:   {len(gzip.compress(content, 6)):,} bytes")
+            if brotli is not None:
+                print(f"  br:     {len(brotli.compress(content, quality=5)):,} bytes")
+            else:
+                print("  br:     not installed")
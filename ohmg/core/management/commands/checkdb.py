@@ -1,4 +1,6 @@
+from django.contrib.auth import get_user_model
 from django.core.management.base import BaseCommand
+from django.db import transaction
 from django.db.models import Q
 
 from ohmg.core.models import Document
@@ -13,6 +15,7 @@ class Command(BaseCommand):
             choices=[
                 "multimasks",
                 "sessions",
+                "user-counts",
             ],
             help="Choose what check to run.",
         )
@@ -60,6 +63,27 @@ class Command(BaseCommand):
             else:
                 return None
 
+        if options["operation"] == "user-counts":
+            print("\nchecking User contribution counts...")
+            fields = ["load_ct", "psesh_ct", "gsesh_ct", "gcp_ct"]
+            users = get_user_model().objects.all()
+            before = {i["pk"]: i for i in users.values("pk", "username", *fields)}
+            with transaction.atomic():
+                get_user_model().reconcile_counts(users)
+                drift = [
+                    (before[i["pk"]], i)
+                    for i in users.values("pk", *fields)
+                    if any(i[f] != before[i["pk"]][f] for f in fields)
+                ]
+                print(f"{len(drift)} users have incorrect counts")
+                if verbose:
+                    for old, new in drift:
+                        print(f"-- {old['username']}: {old} --> {new}")
+                if not options["fix"]:
+                    transaction.set_rollback(True)
+                else:
+                    print("counts fixed")
+
         if options["operation"] == "sessions":
             print("\nchecking PrepSessions...")
             s = PrepSession.objects.filter(doc2__isnull=True)
@@ -0,0 +1,44 @@
+import sys
+
+from django.core.management.base import BaseCommand
+from django.utils.dateparse import parse_datetime
+
+from ohmg.core.exporters.ndjson import iter_layer_records
+
+
+class Command(BaseCommand):
+    help = "Export every layer, with its GCPs, mask, and file urls, as NDJSON."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "-o",
+            "--output",
+            help="file to write to, defaults to stdout",
+        )
+        parser.add_argument(
+            "-i",
+            "--identifier",
+            help="only export the layers of this map",
+        )
+        parser.add_argument(
+            "--modified-since",
+            help="only export layers changed since this ISO 8601 date/time",
+        )
+
+    def handle(self, *args, **options):
+        modified_since = None
+        if options["modified_since"]:
+            modified_since = parse_datetime(options["modified_since"])
+            if modified_since is None:
+                print(f"invalid date/time: {options['modified_since']}")
+                exit()
+
+        records = iter_layer_records(
+            modified_since=modified_since,
+            map_id=options["identifier"],
+        )
+        if options["output"]:
+            with open(options["output"], "w") as out:
+                out.writelines(records)
+        else:
+            sys.stdout.writelines(records)
@@ -1,3 +1,4 @@
+from collections import Counter
 from datetime import datetime
 
 from django.conf import settings
@@ -97,6 +98,11 @@ class Command(BaseCommand):
         parser.add_argument(
             "--opts", nargs="*", help="arguments to pass to selected importer class operation"
         )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            help="number of rows to parse concurrently during a bulk import",
+        )
 
     def handle(self, *args, **options):
         operation = options["operation"]
@@ -125,7 +131,15 @@ class Command(BaseCommand):
                 importer.run_import(**importer_kwargs)
 
             elif options["bulk_file"]:
-                importer.run_bulk_import(options["bulk_file"])
+                results = importer.run_bulk_import(
+                    options["bulk_file"], max_workers=options["workers"]
+                )
+                for result in results:
+                    print(f"row {result['row']}: {result['identifier']} -- {result['status']}")
+                    for error in result["errors"]:
+                        print(f"  {error}")
+                statuses = Counter([i["status"] for i in results])
+                print(", ".join([f"{k}: {v}" for k, v in statuses.items()]))
 
         if operation == "remove":
             try:
@@ -183,6 +197,9 @@ class Command(BaseCommand):
 
             try:
                 map = Map.objects.get(pk=options["pk"])
+                if map.loaded_by_id != user.pk:
+                    get_user_model().adjust_counts(map.loaded_by_id, load_ct=-1)
+                    get_user_model().adjust_counts(user.pk, load_ct=1)
                 map.loaded_by = user
                 map.save()
             except Map.DoesNotExist:
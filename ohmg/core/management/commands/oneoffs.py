@@ -26,7 +26,6 @@ class Command(BaseCommand):
                 "fix-full-region-files",
                 "set-tilejson",
                 "delete-duplicate-regions",
-                "add-masks-to-layers",
             ],
             help="Choose what operation to run.",
         )
@@ -409,24 +408,3 @@ class Command(BaseCommand):
                 if not dry_run:
                     delete_ps.delete()
                     print("deleted")
-
-        ## Mar 11th, 2026
-        ## Pushing all multimask entries directly onto Layers, now that masks are
-        ## stored on Layers, not as a collected set of GeoJSON in LayerSet.multimask
-        elif operation == "add-masks-to-layers":
-            from django.contrib.gis.geos import GEOSGeometry
-
-            from ohmg.core.models import Layer, LayerSet
-
-            for ls in LayerSet.objects.all().order_by("map__title"):
-                print(ls)
-                for layer in ls.get_layers():
-                    print(f"  {layer.slug}")
-                    if ls.multimask and layer.slug in ls.multimask:
-                        print("  -> setting mask from layerset multimask")
-                        mask_geom = ls.multimask[layer.slug]
-                        layer.mask = GEOSGeometry(json.dumps(mask_geom["geometry"]))
-                    else:
-                        print("  -> setting mask to None")
-                        layer.mask = None
-                    layer.save(skip_map_lookup_update=True, set_extent=False)
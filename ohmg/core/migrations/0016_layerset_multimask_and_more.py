@@ -0,0 +1,30 @@
+# Generated by Django 4.2.27 on 2026-10-19 10:12
+
+import django.contrib.gis.db.models.fields
+import django.contrib.postgres.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_remove_layerset_mosaic_geotiff_date_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='layerset',
+            name='multimask',
+            field=django.contrib.gis.db.models.fields.MultiPolygonField(blank=True, help_text='Union of all layer masks, set by refresh_multimask().', null=True, srid=4326),
+        ),
+        migrations.AddField(
+            model_name='layerset',
+            name='multimask_bounds',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.FloatField(), blank=True, null=True, size=4),
+        ),
+        migrations.AddField(
+            model_name='layerset',
+            name='multimask_features',
+            field=models.JSONField(blank=True, help_text='All layer masks as a GeoJSON FeatureCollection, set by refresh_multimask().', null=True),
+        ),
+    ]
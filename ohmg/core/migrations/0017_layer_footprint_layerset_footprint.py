@@ -0,0 +1,33 @@
+# Generated by Django 4.2.27 on 2026-10-19 11:05
+
+import django.contrib.gis.db.models.fields
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_layerset_multimask_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='layer',
+            name='footprint',
+            field=django.contrib.gis.db.models.fields.PolygonField(blank=True, help_text='Spatially indexed polygon version of the extent, set on save.', null=True, srid=4326),
+        ),
+        migrations.AddField(
+            model_name='layerset',
+            name='footprint',
+            field=django.contrib.gis.db.models.fields.PolygonField(blank=True, help_text='Spatially indexed polygon version of the extent, set on save.', null=True, srid=4326),
+        ),
+        migrations.RunSQL(
+            sql="""
+                UPDATE core_layer SET footprint = ST_MakeEnvelope(extent[1], extent[2], extent[3], extent[4], 4326)
+                WHERE extent IS NOT NULL;
+                UPDATE core_layerset SET footprint = ST_MakeEnvelope(extent[1], extent[2], extent[3], extent[4], 4326)
+                WHERE extent IS NOT NULL;
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
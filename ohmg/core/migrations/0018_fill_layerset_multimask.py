@@ -0,0 +1,53 @@
+# Generated by Django 4.2.27 on 2026-10-19 16:40
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_layer_footprint_layerset_footprint'),
+    ]
+
+    operations = [
+        ## same result as LayerSet.refresh_multimask(), for every layerset that doesn't
+        ## have a stored multimask yet
+        migrations.RunSQL(
+            sql="""
+                UPDATE core_layerset SET
+                    multimask_features = agg.features,
+                    multimask = agg.multimask,
+                    multimask_bounds = agg.bounds
+                FROM (
+                    SELECT
+                        ls.id,
+                        jsonb_build_object(
+                            'type', 'FeatureCollection',
+                            'features', COALESCE(
+                                jsonb_agg(
+                                    jsonb_build_object(
+                                        'type', 'Feature',
+                                        'geometry', ST_AsGeoJSON(l.mask)::jsonb,
+                                        'properties', jsonb_build_object('layer', l.slug)
+                                    )
+                                ) FILTER (WHERE l.mask IS NOT NULL),
+                                '[]'::jsonb
+                            )
+                        ) AS features,
+                        ST_Multi(ST_Union(l.mask)) AS multimask,
+                        CASE WHEN ST_Extent(l.mask) IS NULL THEN NULL ELSE ARRAY[
+                            ST_XMin(ST_Extent(l.mask)),
+                            ST_YMin(ST_Extent(l.mask)),
+                            ST_XMax(ST_Extent(l.mask)),
+                            ST_YMax(ST_Extent(l.mask))
+                        ] END AS bounds
+                    FROM core_layerset ls
+                    LEFT JOIN core_layer l ON l.layerset2_id = ls.id
+                    WHERE ls.multimask_features IS NULL
+                    GROUP BY ls.id
+                ) agg
+                WHERE core_layerset.id = agg.id;
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
@@ -83,32 +83,36 @@ class Document(models.Model):
     def lock(self):
         from ohmg.georeference.models import SessionLock
 
-        ct = ContentType.objects.get_for_model(self)
-        locks = SessionLock.objects.filter(target_type=ct, target_id=self.pk)
-        if locks.exists():
-            return locks[0]
-        else:
-            return None
+        ## set by ohmg.georeference.sessions.prefetch_locks()
+        if hasattr(self, "_lock"):
+            return self._lock
 
-    def load_file_from_source(self, username, overwrite=False):
-        log_prefix = f"{self.__str__()} |"
-        logger.info(f"{log_prefix} start load")
-        self.loading_file = True
-        self.save()
+        ct = ContentType.objects.get_for_model(self)
+        return (
+            SessionLock.objects.filter(target_type=ct, target_id=self.pk)
+            .select_related("user", "target_type")
+            .first()
+        )
 
+    def get_source_url(self):
         if self.source_url:
-            src_url = self.source_url
+            return self.source_url
         elif self.iiif_info:
-            src_url = self.iiif_info.replace("info.json", "full/full/0/default.jpg")
-        elif self.source_url:
-            src_url = self.source_url
-        else:
-            logger.warning(f"{log_prefix} no source_url or iiif_info - cancelling download")
-            return
+            return self.iiif_info.replace("info.json", "full/full/0/default.jpg")
+        return None
 
-        if self.file != "" and not overwrite:
-            logger.warning(f"{log_prefix} won't overwrite existing file")
-            return
+    def fetch_source_file(self, overwrite=False):
+        """Download (or copy) the source image for this document into the local cache
+        and convert it to jpg if needed, returning the path to the result. This method
+        makes no database writes, so it is safe to run in a worker thread while other
+        documents are being fetched."""
+
+        log_prefix = f"{self.__str__()} |"
+
+        src_url = self.get_source_url()
+        if src_url is None:
+            logger.warning(f"{log_prefix} no source_url or iiif_info - cancelling download")
+            return None
 
         src_path = Path(src_url)
         tmp_img_dir = Path(settings.CACHE_DIR, "images")
@@ -119,7 +123,7 @@ class Document(models.Model):
             out_file = download_image(src_url, tmp_path, use_cache=not overwrite)
             if out_file is None:
                 logger.error(f"can't get {src_url} -- skipping")
-                return
+                return None
         else:
             if not tmp_path.exists():
                 shutil.copyfile(src_path, tmp_path)
@@ -129,10 +133,32 @@ class Document(models.Model):
 
         if not tmp_path.exists():
             logger.error(f"{log_prefix} can't retrieve source: {src_url}. Moving to next Document.")
+            return None
+
+        return tmp_path
+
+    def load_file_from_source(self, username, overwrite=False, src_file: Path = None):
+        """Attach the source image to this document. If src_file is provided it is
+        assumed to have already been fetched with fetch_source_file()."""
+
+        log_prefix = f"{self.__str__()} |"
+        logger.info(f"{log_prefix} start load")
+
+        if self.file != "" and not overwrite:
+            logger.warning(f"{log_prefix} won't overwrite existing file")
+            return
+
+        self.loading_file = True
+        self.save(update_fields=["loading_file"])
+
+        tmp_path = src_file if src_file else self.fetch_source_file(overwrite=overwrite)
+        if tmp_path is None:
+            self.loading_file = False
+            self.save(update_fields=["loading_file"])
             return
 
         with open(tmp_path, "rb") as new_file:
-            self.file.save(f"{self.slug}{tmp_path.suffix}", File(new_file))
+            self.file.save(f"{self.slug}{tmp_path.suffix}", File(new_file), save=False)
 
         self.load_date = datetime.now()
         self.loading_file = False
@@ -140,6 +166,7 @@ class Document(models.Model):
             self.map.loaded_by = get_user_model().objects.get(username=username)
             self.map.load_date = self.load_date
             self.map.save(update_fields=["loaded_by", "load_date"])
+            get_user_model().adjust_counts(self.map.loaded_by_id, load_ct=1)
         self.save(set_thumbnail=True)
 
     def set_thumbnail(self):
@@ -62,6 +62,12 @@ class Layer(models.Model):
         null=True,
         blank=True,
     )
+    footprint = models.PolygonField(
+        null=True,
+        blank=True,
+        srid=4326,
+        help_text="Spatially indexed polygon version of the extent, set on save.",
+    )
     mask = models.PolygonField(blank=True, null=True)
     file = models.FileField(
         upload_to="layers",
@@ -132,12 +138,16 @@ class Layer(models.Model):
     def lock(self):
         from ohmg.georeference.models import SessionLock
 
+        ## set by ohmg.georeference.sessions.prefetch_locks()
+        if hasattr(self, "_lock"):
+            return self._lock
+
         ct = ContentType.objects.get_for_model(self)
-        locks = SessionLock.objects.filter(target_type=ct, target_id=self.pk)
-        if locks.exists():
-            return locks[0]
-        else:
-            return None
+        return (
+            SessionLock.objects.filter(target_type=ct, target_id=self.pk)
+            .select_related("user", "target_type")
+            .first()
+        )
 
     def set_thumbnail(self):
         if self.file is not None:
@@ -168,12 +178,17 @@ class Layer(models.Model):
             msg = f"Emptied LayerSet {existing_obj} ({existing_obj.pk}) deleted"
             existing_obj.delete()
             logger.info(msg)
+        elif existing_obj and self.mask:
+            existing_obj.refresh_multimask()
 
         # little patch in here to make sure the new Map objects get added to the layerset,
         # before everything is shifted away from the Volume model
         if not layerset.map:
             layerset.map = self.region.document.map
 
+        if self.mask:
+            layerset.refresh_multimask(save=False)
+
         # save here to trigger a recalculation of the layerset's extent
         layerset.save()
 
@@ -211,6 +226,7 @@ class Layer(models.Model):
 
         if set_extent and self.file:
             self.extent = get_extent_from_file(self.file)
+        self.footprint = Polygon.from_bbox(self.extent) if self.extent else None
 
         self.title = self.region.title
         self.nickname = self.region.nickname
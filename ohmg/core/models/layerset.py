@@ -1,3 +1,4 @@
+import json
 import logging
 import urllib.parse
 from typing import TYPE_CHECKING, Iterable, Union
@@ -5,8 +6,12 @@ from typing import TYPE_CHECKING, Iterable, Union
 from django.conf import settings
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.gis.db import models
-from django.contrib.gis.geos import MultiPolygon, Polygon
+from django.contrib.gis.db.models import Extent
+from django.contrib.gis.db.models import Union as GeomUnion
+from django.contrib.gis.db.models.functions import MakeValid
+from django.contrib.gis.geos import GeometryCollection, GEOSException, MultiPolygon, Polygon
 from django.contrib.postgres.fields import ArrayField
+from django.db import DatabaseError, transaction
 from django.utils.functional import cached_property
 from django.utils.safestring import mark_safe
 
@@ -65,6 +70,12 @@ class LayerSet(models.Model):
         null=True,
         blank=True,
     )
+    footprint = models.PolygonField(
+        null=True,
+        blank=True,
+        srid=4326,
+        help_text="Spatially indexed polygon version of the extent, set on save.",
+    )
     xyz_tiles_prefix = models.CharField(
         max_length=200,
         blank=True,
@@ -72,6 +83,23 @@ class LayerSet(models.Model):
     )
     tilejson = models.JSONField(null=True, blank=True)
     multimask_date = models.DateTimeField(blank=True, null=True)
+    multimask_features = models.JSONField(
+        null=True,
+        blank=True,
+        help_text="All layer masks as a GeoJSON FeatureCollection, set by refresh_multimask().",
+    )
+    multimask = models.MultiPolygonField(
+        null=True,
+        blank=True,
+        srid=4326,
+        help_text="Union of all layer masks, set by refresh_multimask().",
+    )
+    multimask_bounds = ArrayField(
+        models.FloatField(),
+        size=4,
+        null=True,
+        blank=True,
+    )
 
     def __str__(self):
         return f"{self.map} - {self.category}"
@@ -91,6 +119,10 @@ class LayerSet(models.Model):
     def get_latest_cog_job(self):
         from ohmg.georeference.models import Job
 
+        ## set by ohmg.api.schemas.prefetch_layersets()
+        if hasattr(self, "_latest_jobs"):
+            return self._latest_jobs["layerset_to_cog"]
+
         ct = ContentType.objects.get_for_model(self)
         job = (
             Job.objects.filter(operation="layerset_to_cog", target_type=ct, target_id=self.pk)
@@ -102,6 +134,10 @@ class LayerSet(models.Model):
     def get_latest_xyz_job(self):
         from ohmg.georeference.models import Job
 
+        ## set by ohmg.api.schemas.prefetch_layersets()
+        if hasattr(self, "_latest_jobs"):
+            return self._latest_jobs["layerset_to_xyz"]
+
         ct = ContentType.objects.get_for_model(self)
         job = (
             Job.objects.filter(operation="layerset_to_xyz", target_type=ct, target_id=self.pk)
@@ -159,27 +195,62 @@ class LayerSet(models.Model):
         else:
             return None
 
+    def refresh_multimask(self, save: bool = True):
+        """Collect the masks of all layers in this LayerSet into a GeoJSON FeatureCollection,
+        and store it along with the union and extent of the masks (both calculated in the
+        database). Must be called whenever a layer's mask changes or a layer is added to or
+        removed from this LayerSet."""
+
+        masked = self.layer_set.filter(mask__isnull=False)
+        fc = {"type": "FeatureCollection", "features": []}
+        for slug, mask in masked.values_list("slug", "mask"):
+            fc["features"].append(
+                {
+                    "type": "Feature",
+                    "geometry": json.loads(mask.geojson),
+                    "properties": {"layer": slug},
+                }
+            )
+        ## invalid masks are repaired before the union, and if it still fails the
+        ## previously stored values are kept, so one bad mask can't break mask editing
+        try:
+            with transaction.atomic():
+                agg = masked.aggregate(union=GeomUnion(MakeValid("mask")), extent=Extent("mask"))
+        except (DatabaseError, GEOSException) as e:
+            logger.error(f"{self}: unable to union layer masks, multimask not refreshed: {e}")
+            return
+        union = agg["union"]
+        if isinstance(union, Polygon):
+            union = MultiPolygon(union, srid=union.srid)
+        elif isinstance(union, GeometryCollection) and not isinstance(union, MultiPolygon):
+            ## MakeValid can leave slivers as lines or points, only the polygons are kept
+            polygons = []
+            for geom in union:
+                if isinstance(geom, Polygon):
+                    polygons.append(geom)
+                elif isinstance(geom, MultiPolygon):
+                    polygons += list(geom)
+            union = MultiPolygon(polygons, srid=union.srid) if polygons else None
+
+        self.multimask_features = fc
+        self.multimask = union
+        self.multimask_bounds = list(agg["extent"]) if agg["extent"] else None
+        if save and self.pk:
+            self.save(update_fields=["multimask_features", "multimask", "multimask_bounds"])
+
     @property
     def multimask_extent(self):
-        """Calculate an extent based any existing masks of layers in this LayerSet.
-        If no layer have masks then return None."""
-        feature_polygons = []
-        for feat in self.multimask_geojson["features"]:
-            poly = Polygon(feat["geometry"]["coordinates"][0])
-            feature_polygons.append(poly)
-        return (
-            MultiPolygon(feature_polygons, srid=4326).extent if len(feature_polygons) > 0 else None
-        )
+        """Extent of all layer masks in this LayerSet, or None if no layers have masks.
+        Read-only, the stored value is set by refresh_multimask()."""
+        return tuple(self.multimask_bounds) if self.multimask_bounds else None
 
     @property
     def multimask_geojson(self) -> dict:
-        """Collect all masks from layers in this layerset and return as GeoJSON Feature Collection"""
-        fc = {"type": "FeatureCollection", "features": []}
-        for layer in self.get_layers():
-            mask_geojson = layer.mask_geojson_feature
-            if mask_geojson:
-                fc["features"].append(mask_geojson)
-        return fc
+        """All masks from layers in this layerset as a GeoJSON Feature Collection.
+        Read-only, the stored value is set by refresh_multimask()."""
+        if self.multimask_features is None:
+            return {"type": "FeatureCollection", "features": []}
+        return self.multimask_features
 
     def queue_mosaic_cog(self) -> int:
         """Creates a new job to generate a mosaic cog from this layerset.
@@ -215,15 +286,9 @@ class LayerSet(models.Model):
 
     def save(self, set_tilejson: bool = False, *args, **kwargs):
         if self._state.adding is False:
-            extents = self.get_layers().values_list("extent", flat=True)
-            layer_extents = []
-            for extent in extents:
-                if extent:
-                    poly = Polygon().from_bbox(extent)
-                    layer_extents.append(poly)
-            if layer_extents:
-                combined = MultiPolygon(layer_extents)
-                self.extent = combined.extent
+            extent = self.get_layers().aggregate(extent=Extent("footprint"))["extent"]
+            if extent:
+                self.extent = list(extent)
             if (set_tilejson or self.tilejson is None) and self.mosaic_geotiff:
                 self.tilejson = {
                     "tilejson": "2.2.0",
@@ -237,4 +302,6 @@ class LayerSet(models.Model):
                     "attribution": "<a href='https://oldinsurancemaps.net'>OldInsuranceMaps</a>; <a href='https://loc.gov/collections/sanborn-maps'>LOC</a>",
                 }
 
+        self.footprint = Polygon.from_bbox(self.extent) if self.extent else None
+
         return super(self.__class__, self).save(*args, **kwargs)
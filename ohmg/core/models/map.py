@@ -1,12 +1,14 @@
 import logging
+from bisect import insort
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 from django.conf import settings
 from django.contrib.auth.models import Group
 from django.contrib.gis.db import models
-from django.contrib.gis.geos import MultiPolygon, Polygon
+from django.contrib.gis.db.models import Extent
 from django.db import transaction
 from django.db.models import Q
-from natsort import natsorted
+from natsort import natsort_keygen, natsorted
 
 from ohmg.places.models import Place
 
@@ -188,15 +190,7 @@ class Map(models.Model):
 
     @property
     def extent(self):
-        layerset_extents = []
-        for ls in self.layerset_set.all():
-            if ls.extent:
-                poly = Polygon().from_bbox(ls.extent)
-                layerset_extents.append(poly)
-        if layerset_extents:
-            return MultiPolygon(layerset_extents).extent
-        else:
-            return None
+        return self.layerset_set.aggregate(extent=Extent("footprint"))["extent"]
 
     @property
     def gt_exists(self):
@@ -315,17 +309,39 @@ class Map(models.Model):
         logger.debug(f"Map {self.title} ({self.pk}) has {len(self.documents.all())} Documents")
         self.update_item_lookup()
 
-    def load_all_document_files(self, username, overwrite=False):
+    def load_all_document_files(self, username, overwrite=False, max_workers=None):
+        """Fetch the source files for all documents concurrently, and then attach
+        each file to its document (saving, thumbnail generation) on the calling thread
+        as soon as its download completes. The number of simultaneous downloads is bounded
+        by settings.DOCUMENT_LOAD_MAX_WORKERS and further limited per host."""
+
         self.loading_documents = True
         self.save()
-        for document in natsorted(self.documents.all(), key=lambda k: k.title):
-            if not document.file and not overwrite:
+
+        to_load = [
+            d
+            for d in natsorted(self.documents.all(), key=lambda k: k.title)
+            if overwrite or not d.file
+        ]
+        max_workers = max_workers or settings.DOCUMENT_LOAD_MAX_WORKERS
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                executor.submit(document.fetch_source_file, overwrite): document
+                for document in to_load
+            }
+            for future in as_completed(futures):
+                document = futures[future]
                 try:
-                    document.load_file_from_source(username, overwrite=True)
+                    src_file = future.result()
+                    if src_file is None:
+                        continue
+                    document.load_file_from_source(username, overwrite=True, src_file=src_file)
                 except Exception as e:
                     logger.error(f"error loading document {document.pk}: {e}")
                     document.loading_file = False
                     document.save()
+
         self.loading_documents = False
         self.save()
 
@@ -336,26 +352,64 @@ class Map(models.Model):
     def update_place_counts(self):
         locale = self.get_locale()
         if locale is not None:
-            with transaction.atomic():
-                locale.volume_count += 1
-                locale.volume_count_inclusive += 1
-                locale.save(update_fields=["volume_count", "volume_count_inclusive"])
-                parents = locale.direct_parents.all()
-                while parents:
-                    new_parents = []
-                    for p in parents:
-                        p.volume_count_inclusive += 1
-                        p.save(update_fields=["volume_count_inclusive"])
-                        new_parents += list(p.direct_parents.all())
-                    parents = new_parents
+            locale.update_volume_counts(1)
 
     def get_absolute_url(self):
         return f"/map/{self.pk}/"
 
-    def update_item_lookup(self):
-        from ohmg.api.schemas import DocumentSchema, LayerSchema, RegionSchema
+    ## which lists in the item lookup hold each kind of item
+    ITEM_LOOKUP_CATEGORIES = {
+        "document": ["unprepared"],
+        "region": ["prepared", "nonmaps", "skipped"],
+        "layer": ["georeferenced"],
+    }
+
+    def update_item_lookup(self, changed: dict = None):
+        """Rebuild the item lookup and the item counts for this map. If changed is provided,
+        as a dict of {"document"|"region"|"layer": [pks]}, only those items are re-serialized
+        and moved to their current lists within the existing lookup. Otherwise (or if there
+        is no existing lookup) the entire lookup is rebuilt from scratch."""
+
+        with transaction.atomic():
+            ## lock the row so concurrent updates to this lookup can't be lost
+            current = Map.objects.select_for_update().only("item_lookup").get(pk=self.pk)
+            items = current.item_lookup
+            complete = isinstance(items, dict) and all(
+                cat in items for cats in self.ITEM_LOOKUP_CATEGORIES.values() for cat in cats
+            )
+            if changed and complete:
+                self._apply_item_lookup_changes(items, changed)
+            else:
+                items = self._build_item_lookup()
+            self.item_lookup = items
+            self._set_item_lookup_counts()
+            self.save(
+                update_fields=[
+                    "item_lookup",
+                    "document_ct",
+                    "unprepared_ct",
+                    "region_ct",
+                    "prepared_ct",
+                    "layer_ct",
+                    "main_layer_ct",
+                    "skip_ct",
+                    "nonmap_ct",
+                    "completion_pct",
+                    "multimask_ct",
+                    "multimask_rank",
+                ]
+            )
 
-        regions = self.regions
+    def _build_item_lookup(self) -> dict:
+        from ohmg.api.schemas import (
+            DocumentSchema,
+            LayerSchema,
+            RegionSchema,
+            prefetch_layers,
+            prefetch_regions,
+        )
+
+        regions = prefetch_regions(self.regions)
         items = {
             "unprepared": [
                 DocumentSchema.from_orm(i).dict() for i in self.documents.filter(prepared=False)
@@ -366,7 +420,7 @@ class Map(models.Model):
                     skipped=True
                 )
             ],
-            "georeferenced": [LayerSchema.from_orm(i).dict() for i in self.layers],
+            "georeferenced": [LayerSchema.from_orm(i).dict() for i in prefetch_layers(self.layers)],
             "nonmaps": [
                 RegionSchema.from_orm(i).dict() for i in regions.exclude(category__slug="map")
             ],
@@ -379,66 +433,97 @@ class Map(models.Model):
         }
         for cat in ["unprepared", "prepared", "georeferenced", "nonmaps", "skipped"]:
             items[cat] = natsorted(items[cat], key=lambda k: k["title"])
-        self.item_lookup = items
+        return items
+
+    def _apply_item_lookup_changes(self, items: dict, changed: dict):
+        """Remove the changed items from every list they could be in, and insert the ones
+        that still exist into the list(s) matching their current state, keeping each list
+        in natural sort order."""
+        from ohmg.api.schemas import (
+            DocumentSchema,
+            LayerSchema,
+            RegionSchema,
+            prefetch_layers,
+            prefetch_regions,
+        )
+
+        from .document import Document
+        from .layer import Layer
+        from .region import Region
+
+        for kind, ids in changed.items():
+            for cat in self.ITEM_LOOKUP_CATEGORIES[kind]:
+                items[cat] = [i for i in items[cat] if i["id"] not in ids]
 
-        document_ct = self.documents.all().count()
-        unprepared_ct = len(items["unprepared"])
-        region_ct = self.regions.count()
-        prepared_ct = len(items["prepared"])
-        layer_ct = self.layers.count()
-        skip_ct = len(items["skipped"])
-        nonmap_ct = len(items["nonmaps"])
+        title_key = natsort_keygen(key=lambda k: k["title"])
 
-        completion_pct = 0
-        if layer_ct > 0:
-            completion_pct = int((layer_ct / (unprepared_ct + prepared_ct + layer_ct)) * 100)
+        documents = Document.objects.filter(
+            pk__in=changed.get("document", []), map=self, prepared=False
+        )
+        for document in documents:
+            insort(items["unprepared"], DocumentSchema.from_orm(document).dict(), key=title_key)
+
+        regions = prefetch_regions(
+            Region.objects.filter(pk__in=changed.get("region", []), document__map=self)
+        ).select_related("category")
+        for region in regions:
+            is_map = region.category is not None and region.category.slug == "map"
+            cats = []
+            if is_map and not region.georeferenced and not region.skipped:
+                cats.append("prepared")
+            if not is_map:
+                cats.append("nonmaps")
+            if region.skipped:
+                cats.append("skipped")
+            if cats:
+                entry = RegionSchema.from_orm(region).dict()
+                for cat in cats:
+                    insort(items[cat], entry, key=title_key)
+
+        layers = prefetch_layers(
+            Layer.objects.filter(pk__in=changed.get("layer", []), region__document__map=self)
+        )
+        for layer in layers:
+            insort(items["georeferenced"], LayerSchema.from_orm(layer).dict(), key=title_key)
+
+    def _set_item_lookup_counts(self):
+        """Set all count fields from the current item lookup, using count queries for
+        the totals that the lookup doesn't hold."""
+
+        items = self.item_lookup
+        self.document_ct = self.documents.all().count()
+        self.unprepared_ct = len(items["unprepared"])
+        self.region_ct = self.regions.count()
+        self.prepared_ct = len(items["prepared"])
+        self.layer_ct = len(items["georeferenced"])
+        self.skip_ct = len(items["skipped"])
+        self.nonmap_ct = len(items["nonmaps"])
+
+        self.completion_pct = 0
+        if self.layer_ct > 0:
+            self.completion_pct = int(
+                (self.layer_ct / (self.unprepared_ct + self.prepared_ct + self.layer_ct)) * 100
+            )
 
         multimask_ct, multimask_rank = 0, 0
+        main_lyrs_ct = 0
         main_layerset = self.get_layerset("main-content")
         if main_layerset:
-            main_lyrs_ct = main_layerset.get_layers().count()
-        else:
-            main_lyrs_ct = 0
+            main_lyrs = main_layerset.get_layers()
+            main_lyrs_ct = main_lyrs.count()
+            multimask_ct = main_lyrs.filter(mask__isnull=False).count()
 
         if main_lyrs_ct != 0:
             # make sure 0/0 appears at the very bottom, then 0/1, 0/2, etc.
             multimask_rank = main_lyrs_ct * 0.000001
-
-        if main_layerset:
-            multimask_ct = len(main_layerset.multimask_geojson["features"])
-            if multimask_ct > 0 and main_lyrs_ct > 0:
+            if multimask_ct > 0:
                 pct = multimask_ct / main_lyrs_ct
                 multimask_rank += pct * 0.000001
 
-        self.document_ct = document_ct
-        self.unprepared_ct = unprepared_ct
-        self.region_ct = region_ct
-        self.prepared_ct = prepared_ct
-        self.layer_ct = layer_ct
         self.main_layer_ct = main_lyrs_ct
-        self.skip_ct = skip_ct
-        self.nonmap_ct = nonmap_ct
-        self.completion_pct = completion_pct
         self.multimask_ct = multimask_ct
         self.multimask_rank = multimask_rank
 
-        self.save(
-            update_fields=[
-                "item_lookup",
-                "document_ct",
-                "unprepared_ct",
-                "region_ct",
-                "prepared_ct",
-                "layer_ct",
-                "main_layer_ct",
-                "skip_ct",
-                "nonmap_ct",
-                "completion_pct",
-                "multimask_ct",
-                "multimask_rank",
-            ]
-        )
-
     def get_session_summary(self):
         from ohmg.georeference.models import SessionBase
 
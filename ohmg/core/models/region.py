@@ -105,12 +105,16 @@ class Region(models.Model):
     def lock(self):
         from ohmg.georeference.models import SessionLock
 
+        ## set by ohmg.georeference.sessions.prefetch_locks()
+        if hasattr(self, "_lock"):
+            return self._lock
+
         ct = ContentType.objects.get_for_model(self)
-        locks = SessionLock.objects.filter(target_type=ct, target_id=self.pk)
-        if locks.exists():
-            return locks[0]
-        else:
-            return None
+        return (
+            SessionLock.objects.filter(target_type=ct, target_id=self.pk)
+            .select_related("user", "target_type")
+            .first()
+        )
 
     def set_thumbnail(self):
         if self.file is not None:
@@ -3,6 +3,7 @@ import logging
 from django.db.models import signals
 from django.dispatch import receiver
 
+from ohmg.core.lookups import request_item_lookup_update
 from ohmg.core.models import (
     Document,
     Layer,
@@ -18,11 +19,11 @@ logger = logging.getLogger(__name__)
 def update_item_lookup(sender, instance, **kwargs):
     if not hasattr(instance, "skip_map_lookup_update") or instance.skip_map_lookup_update is False:
         if sender == Document:
-            instance.map.update_item_lookup()
+            request_item_lookup_update(instance.map_id, "document", [instance.pk])
         if sender == Region:
-            instance.document.map.update_item_lookup()
+            request_item_lookup_update(instance.document.map_id, "region", [instance.pk])
         if sender == Layer:
-            instance.region.document.map.update_item_lookup()
+            request_item_lookup_update(instance.region.document.map_id, "layer", [instance.pk])
 
 
 @receiver([signals.post_delete], sender=Document)
@@ -56,3 +57,5 @@ def handle_layer_deletion(sender, instance, **kwargs):
     if instance.layerset2:
         if instance.layerset2.get_layers().count() == 0:
             instance.layerset2.delete()
+        elif instance.mask:
+            instance.layerset2.refresh_multimask()
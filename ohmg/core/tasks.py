@@ -1,5 +1,6 @@
 from ohmg.conf.celery import app
 
+from .lookups import clear_pending, rebuild_item_lookup
 from .models import Document, Map
 
 
@@ -15,3 +16,10 @@ def load_document_file_as_task(document_id, username):
     doc = Document.objects.get(pk=document_id)
     doc.load_file_from_source(username, overwrite=True)
     return document_id
+
+
+@app.task
+def update_item_lookup_as_task(map_id):
+    clear_pending(map_id)
+    rebuild_item_lookup(map_id)
+    return map_id
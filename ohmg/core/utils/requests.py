@@ -1,57 +1,174 @@
 import json
 import logging
-import shutil
+import threading
 import time
+from contextlib import contextmanager
 from json.decoder import JSONDecodeError
 from pathlib import Path
+from urllib.parse import urlparse
 
 import requests
 from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from .response_store import StoredResponse, get_response_store
 
 logger = logging.getLogger(__name__)
 
+_http_session = None
+_http_session_lock = threading.Lock()
+
+_host_semaphores = {}
+_host_semaphores_lock = threading.Lock()
+
+
+def get_http_session() -> requests.Session:
+    """Return a process-wide requests.Session, so that connections to upstream
+    hosts (mostly LOC) are pooled and kept alive across downloads."""
+
+    global _http_session
+    with _http_session_lock:
+        if _http_session is None:
+            pool_size = max(settings.DOCUMENT_LOAD_MAX_WORKERS, 10)
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            session = requests.Session()
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _http_session = session
+    return _http_session
+
+
+@contextmanager
+def host_slot(url: str):
+    """Block until a connection slot is free for the host of this url, so that
+    concurrent downloads never hit a single host with more than
+    settings.DOWNLOAD_MAX_CONNECTIONS_PER_HOST requests at a time."""
+
+    host = urlparse(url).netloc
+    with _host_semaphores_lock:
+        if host not in _host_semaphores:
+            _host_semaphores[host] = threading.BoundedSemaphore(
+                settings.DOWNLOAD_MAX_CONNECTIONS_PER_HOST
+            )
+        semaphore = _host_semaphores[host]
+    with semaphore:
+        yield
+
+
+def _expected_size(response: requests.Response, offset: int):
+    """Return the full size of the remote file based on the response headers, or None
+    if it can't be determined."""
+
+    content_range = response.headers.get("Content-Range")
+    if response.headers.get("Content-Encoding", "identity") != "identity":
+        ## lengths refer to the encoded body, not what is written to disk
+        return None
+    if content_range and "/" in content_range:
+        total = content_range.rsplit("/", 1)[1]
+        if total.isdigit():
+            return int(total)
+    content_length = response.headers.get("Content-Length")
+    if content_length and content_length.isdigit():
+        return offset + int(content_length)
+    return None
+
+
+def download_image(
+    url: str,
+    out_path: Path,
+    retries: int = 3,
+    use_cache: bool = True,
+    backoff: float = 2,
+    session: requests.Session = None,
+):
+    """Download the file at url to out_path. Content is streamed into a .part file
+    next to out_path, which is only renamed to out_path once its size has been verified,
+    so an interrupted download is never mistaken for a cached file. If a .part file is
+    already present the download is resumed from where it left off with a Range request."""
 
-def download_image(url: str, out_path: Path, retries: int = 3, use_cache: bool = True):
     if out_path.is_file() and use_cache:
         print(f"using cached file: {out_path}")
         return out_path
 
-    # basic download code: https://stackoverflow.com/a/18043472/3873885
-    while True:
-        logger.debug(f"request {url}")
-        response = requests.get(url, stream=True)
-        if response.status_code == 200:
-            with open(out_path, "wb") as out_file:
-                shutil.copyfileobj(response.raw, out_file)
-            return out_path
-        else:
-            logger.warning(f"response code: {response.status_code} retries left: {retries}")
-            time.sleep(5)
-            retries -= 1
-            if retries == 0:
-                logger.warning("request failed, cancelling")
-                return None
+    if session is None:
+        session = get_http_session()
+
+    part_path = out_path.with_name(out_path.name + ".part")
+    if not use_cache:
+        part_path.unlink(missing_ok=True)
+
+    for attempt in range(retries):
+        offset = part_path.stat().st_size if part_path.is_file() else 0
+        headers = {"Range": f"bytes={offset}-"} if offset else {}
+        logger.debug(f"request {url} (offset {offset})")
+        try:
+            with host_slot(url):
+                with session.get(url, headers=headers, stream=True, timeout=60) as response:
+                    status = response.status_code
+                    if status == 416:
+                        ## the range is unsatisfiable, so the part file is bad: start over
+                        part_path.unlink(missing_ok=True)
+                    elif status in (200, 206):
+                        ## a 200 means the server ignored the Range header
+                        if status == 200:
+                            offset = 0
+                        expected = _expected_size(response, offset)
+                        with open(part_path, "ab" if offset else "wb") as out_file:
+                            for chunk in response.iter_content(chunk_size=1024 * 1024):
+                                out_file.write(chunk)
+                        size = part_path.stat().st_size
+                        if expected is None or size == expected:
+                            part_path.replace(out_path)
+                            return out_path
+                        status = f"incomplete download ({size} of {expected} bytes)"
+                        if size > expected:
+                            part_path.unlink()
+        except requests.RequestException as e:
+            status = e
+        retries_left = retries - attempt - 1
+        logger.warning(f"response: {status} retries left: {retries_left}")
+        if retries_left > 0:
+            ## exponential backoff between attempts: 2, 4, 8... seconds by default
+            time.sleep(backoff * 2**attempt)
+
+    logger.warning("request failed, cancelling")
+    return None
 
 
 class CacheableRequest:
+    """A GET request whose response body is kept in the shared response store (see
+    ohmg.core.utils.response_store). Stored responses older than ttl seconds are
+    revalidated with If-None-Match/If-Modified-Since; a ttl of 0 keeps them forever.
+
+    Responses from the legacy one-file-per-url cache in CACHE_DIR/<cache_subdir> are
+    still read, and are moved into the store the first time they are used."""
+
     def __init__(
-        self, url: str, cache_subdir: str = "requests", verbose: bool = False, delay: int = 0
+        self,
+        url: str,
+        cache_subdir: str = "requests",
+        verbose: bool = False,
+        delay: int = 0,
+        ttl: int = None,
     ):
         self.url: str = url
+        self.cache_subdir: str = cache_subdir
         self.cache_dir: Path = settings.CACHE_DIR / cache_subdir
         self.cache_path: Path = self.cache_dir / self.url.replace("/", "__")
         self.verbose: bool = verbose
         self.delay: int = delay
+        self.ttl: int = settings.RESPONSE_CACHE_TTL if ttl is None else ttl
+        self.store = get_response_store()
 
-        self.cache_dir.mkdir(exist_ok=True)
-
-    def get_response(self):
+    def get_response(self, headers: dict = None):
         try:
             if self.verbose and self.delay > 0:
                 logger.info(f"waiting {self.delay} seconds before making a request...")
             time.sleep(self.delay)
             logger.info("making request...")
-            response = requests.get(self.url)
+            session = get_http_session()
+            with host_slot(self.url):
+                response = session.get(self.url, headers=headers, timeout=60)
             if response.status_code in [500, 503]:
                 msg = f"{response.status_code} error, retrying in 5 seconds..."
                 logger.warning(msg)
@@ -60,9 +177,11 @@ class CacheableRequest:
                 time.sleep(5)
                 if self.verbose:
                     print("making request")
-                response = requests.get(self.url)
+                with host_slot(self.url):
+                    response = session.get(self.url, headers=headers, timeout=60)
             return response
         except (
+            requests.RequestException,
             ConnectionError,
             ConnectionRefusedError,
             ConnectionAbortedError,
@@ -73,43 +192,66 @@ class CacheableRequest:
             logger.warning(e)
             return
 
+    def _get_stored(self) -> StoredResponse:
+        stored = self.store.get(self.url)
+        if stored is None and self.cache_path.is_file():
+            with open(self.cache_path, "rb") as o:
+                body = o.read()
+            self.store.put(self.url, body, namespace=self.cache_subdir)
+            self.cache_path.unlink()
+            stored = StoredResponse(self.url, body, None, None, time.time())
+        return stored
+
+    def get_body(self, use_cache=True, validate=None) -> bytes:
+        """Return the raw response body, from the store if possible. If validate is
+        provided, it is called on a newly fetched body and must not raise before the
+        body is stored."""
+
+        stored = self._get_stored() if use_cache else None
+        if stored and stored.is_fresh(self.ttl):
+            return stored.body
+
+        headers = {}
+        if stored and stored.etag:
+            headers["If-None-Match"] = stored.etag
+        if stored and stored.last_modified:
+            headers["If-Modified-Since"] = stored.last_modified
+
+        response = self.get_response(headers=headers)
+        if response is not None and response.status_code == 304 and stored:
+            self.store.touch(self.url)
+            return stored.body
+        if not response:
+            ## fall back on a stale copy if the upstream server is unavailable
+            return stored.body if stored else None
+
+        body = response.content
+        if validate:
+            validate(body)
+        self.store.put(
+            self.url,
+            body,
+            namespace=self.cache_subdir,
+            etag=response.headers.get("ETag"),
+            last_modified=response.headers.get("Last-Modified"),
+        )
+        return body
+
     def get_content(self, use_cache=True) -> str:
-        ## run the request if necessary
-        if not use_cache or not self.cache_path.is_file():
-            response = self.get_response()
-            if not response:
-                return
-            content = response.content.decode("utf-8")
-            ## ideally this would be async so the response can be returned
-            ## without having to wait for the file cache to be written
-            with open(self.cache_path, "w") as o:
-                o.write(content)
-            return content
-        else:
-            with open(self.cache_path, "r") as o:
-                return o.read()
+        body = self.get_body(use_cache=use_cache)
+        if body is None:
+            return
+        return body.decode("utf-8")
 
     def get_json_content(self, use_cache=True) -> dict:
-        ## run the request if necessary
-        if not use_cache or not self.cache_path.is_file():
-            response = self.get_response()
-            if not response:
-                return
-            try:
-                content = json.loads(response.content)
-            except JSONDecodeError:
-                msg = f"Can't decode this JSON: {content}"
-                print(msg)
-                logger.warning(msg)
-                return
-
-            ## ONLY SAVE TO CACHE AFTER JSON IS SUCCESSFULLY PARSED.
-            ## also, ideally this would be async so the response can be returned
-            ## without having to wait for the file cache to be written
-            with open(self.cache_path, "w") as o:
-                json.dump(content, o, indent=2)
-            return content
-        ## otherwise load content from file
-        else:
-            with open(self.cache_path, "r") as o:
-                return json.load(o)
+        ## ONLY SAVE TO STORE AFTER JSON IS SUCCESSFULLY PARSED.
+        try:
+            body = self.get_body(use_cache=use_cache, validate=json.loads)
+        except JSONDecodeError as e:
+            msg = f"Can't decode JSON from {self.url}: {e}"
+            print(msg)
+            logger.warning(msg)
+            return
+        if body is None:
+            return
+        return json.loads(body)
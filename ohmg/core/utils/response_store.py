@@ -0,0 +1,122 @@
+import logging
+import sqlite3
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import NamedTuple
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class StoredResponse(NamedTuple):
+    url: str
+    body: bytes
+    etag: str
+    last_modified: str
+    fetched_at: float
+
+    def is_fresh(self, ttl: int) -> bool:
+        """A ttl of 0 (or None) means that stored responses never go stale."""
+        if not ttl:
+            return True
+        return time.time() - self.fetched_at < ttl
+
+
+class ResponseStore:
+    """A single-file SQLite store for HTTP response bodies, keyed by url. Bodies are
+    zlib-compressed, and the ETag/Last-Modified headers are kept alongside them so that
+    stale entries can be revalidated with a conditional request.
+
+    Each thread gets its own connection, and the database runs in WAL mode so that
+    concurrent readers are not blocked by a writer."""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS responses (
+            url TEXT PRIMARY KEY,
+            namespace TEXT NOT NULL,
+            body BLOB NOT NULL,
+            etag TEXT,
+            last_modified TEXT,
+            fetched_at REAL NOT NULL
+        )
+    """
+
+    def __init__(self, path: Path, write_behind: bool = False):
+        self.path = Path(path)
+        self.path.parent.mkdir(exist_ok=True, parents=True)
+        self._local = threading.local()
+        self._executor = ThreadPoolExecutor(max_workers=1) if write_behind else None
+        with self._connection() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(self.SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            self._local.conn = conn
+        return conn
+
+    def get(self, url: str) -> StoredResponse:
+        row = (
+            self._connection()
+            .execute(
+                "SELECT url, body, etag, last_modified, fetched_at FROM responses WHERE url = ?",
+                (url,),
+            )
+            .fetchone()
+        )
+        if row is None:
+            return None
+        return StoredResponse(row[0], zlib.decompress(row[1]), *row[2:])
+
+    def _put(self, url, namespace, body, etag, last_modified, fetched_at):
+        with self._connection() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses "
+                "(url, namespace, body, etag, last_modified, fetched_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (url, namespace, zlib.compress(body), etag, last_modified, fetched_at),
+            )
+
+    def put(
+        self,
+        url: str,
+        body: bytes,
+        namespace: str = "requests",
+        etag: str = None,
+        last_modified: str = None,
+    ):
+        args = (url, namespace, body, etag, last_modified, time.time())
+        if self._executor:
+            self._executor.submit(self._put, *args)
+        else:
+            self._put(*args)
+
+    def touch(self, url: str):
+        """Mark a stored response as fresh again, after a 304 Not Modified."""
+        with self._connection() as conn:
+            conn.execute("UPDATE responses SET fetched_at = ? WHERE url = ?", (time.time(), url))
+
+    def delete(self, url: str):
+        with self._connection() as conn:
+            conn.execute("DELETE FROM responses WHERE url = ?", (url,))
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_response_store() -> ResponseStore:
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ResponseStore(
+                Path(settings.CACHE_DIR, "responses.sqlite3"),
+                write_behind=settings.RESPONSE_CACHE_WRITE_BEHIND,
+            )
+    return _store
@@ -19,20 +19,24 @@ from ohmg.api.schemas import (
     MapFullSchema,
     MapResourcesSchema,
     MapUserSchema,
-    PlaceFullSchema,
     ResourceFullSchema,
+    prefetch_layersets,
 )
 from ohmg.conf.http import (
     JsonResponseFail,
     JsonResponseNotFound,
     JsonResponseSuccess,
     JsonResponseUnauthorized,
+    conditional_response,
     generate_ohmg_context,
     validate_post_request,
 )
+from ohmg.conf.renderers import FastJsonResponse
 from ohmg.georeference.models import GCP, SessionBase
+from ohmg.places.cache import get_place_json
 
 from .exporters.qlr import generate_qlr_content
+from .lookups import request_item_lookup_update
 from .models import (
     Document,
     Layer,
@@ -88,9 +92,11 @@ class MapView(View):
 
         session_summary = map.get_session_summary()
 
-        locale_json = PlaceFullSchema.from_orm(map.get_locale()).dict()
+        locale_json = get_place_json(map.get_locale())
 
-        layersets = [LayerSetSchema.from_orm(i).dict() for i in map.layerset_set.all()]
+        layersets = [
+            LayerSetSchema.from_orm(i).dict() for i in prefetch_layersets(map.layerset_set.all())
+        ]
         layerset_categories = list(LayerSetCategory.objects.all().values("slug", "display_name"))
 
         context_dict = {
@@ -123,13 +129,13 @@ class MapView(View):
             map = Map.objects.get(pk=identifier)
             load_map_documents_as_task.apply_async((identifier, request.user.username))
             map_json = MapFullSchema.from_orm(map).dict()
-            return JsonResponse(map_json)
+            return FastJsonResponse(map_json)
 
         elif operation == "refresh-lookups":
             map = get_object_or_404(Map.objects.prefetch_related(), pk=identifier)
             map.update_item_lookup()
             map_json = MapFullSchema.from_orm(map).dict()
-            return JsonResponse(map_json)
+            return FastJsonResponse(map_json)
 
 
 class MapContributorsView(View):
@@ -175,7 +181,7 @@ class GenericResourceView(View):
             return HttpResponse("Unauthorized: You do not have access to this item.", status=401)
 
         map_json = MapResourcesSchema.from_orm(resource.map).dict()
-        place_json = PlaceFullSchema.from_orm(resource.map.get_locale()).dict()
+        place_json = get_place_json(resource.map.get_locale())
         resource_json = ResourceFullSchema.from_orm(resource).dict()
 
         layer = None
@@ -367,25 +373,41 @@ class ResourceDerivativeView(View):
             if not layer:
                 raise Http404
 
+            ## validators for the qlr, tilejson, and services responses
+            etag_parts = [layer.pk, layer.last_updated, derivative, raw, settings.TITILER_HOST]
+            public = layer.map.access_level == "any"
+
             if derivative == "qlr":
-                xml_str = generate_qlr_content(layer)
 
-                filename = slugify(layer.title)
+                def build_qlr():
+                    xml_str = generate_qlr_content(layer)
 
-                if raw.lower() == "true":
-                    return HttpResponse(xml_str, content_type="text/xml")
+                    filename = slugify(layer.title)
 
-                response = FileResponse(xml_str, content_type="text/xml")
-                response["Content-Length"] = len(xml_str)
-                response["Content-Disposition"] = f'attachment; filename="{filename}.qlr"'
-                return response
+                    if raw.lower() == "true":
+                        return HttpResponse(xml_str, content_type="text/xml")
+
+                    response = FileResponse(xml_str, content_type="text/xml")
+                    response["Content-Length"] = len(xml_str)
+                    response["Content-Disposition"] = f'attachment; filename="{filename}.qlr"'
+                    return response
+
+                return conditional_response(
+                    request, build_qlr, etag_parts, layer.last_updated, public
+                )
 
             if derivative == "cog":
                 return redirect(get_file_url(layer))
 
             if derivative == "tilejson":
                 if layer.tilejson:
-                    return JsonResponse(layer.tilejson)
+                    return conditional_response(
+                        request,
+                        lambda: FastJsonResponse(layer.tilejson),
+                        etag_parts,
+                        layer.last_updated,
+                        public,
+                    )
                 else:
                     raise Http404
 
@@ -400,16 +422,22 @@ class ResourceDerivativeView(View):
                 return redirect(u)
 
             if derivative == "services":
-                file_url_encoded = quote(get_file_url(layer), safe="")
-                xyz_base = (
-                    f"{settings.TITILER_HOST}/cog/tiles/WebMercatorQuad/{{z}}/{{x}}/{{y}}.png?"
-                )
-                return JsonResponse(
-                    {
-                        "xyz": f"{xyz_base}&url={file_url_encoded}",
-                        "wms": f"{settings.TITILER_HOST}/cog/wms/?LAYERS={file_url_encoded}&VERSION=1.1.1",
-                        "tilejson": f"{settings.SITEURL}layer/{pk}/tilejson",
-                    }
+
+                def build_services():
+                    file_url_encoded = quote(get_file_url(layer), safe="")
+                    xyz_base = (
+                        f"{settings.TITILER_HOST}/cog/tiles/WebMercatorQuad/{{z}}/{{x}}/{{y}}.png?"
+                    )
+                    return JsonResponse(
+                        {
+                            "xyz": f"{xyz_base}&url={file_url_encoded}",
+                            "wms": f"{settings.TITILER_HOST}/cog/wms/?LAYERS={file_url_encoded}&VERSION=1.1.1",
+                            "tilejson": f"{settings.SITEURL}layer/{pk}/tilejson",
+                        }
+                    )
+
+                return conditional_response(
+                    request, build_services, etag_parts, layer.last_updated, public
                 )
 
         else:
@@ -472,6 +500,7 @@ class LayerSetView(View):
             if errors:
                 return JsonResponseFail("<br/>".join([f"{i[0]}: {i[1]}" for i in errors]))
 
+            updated_ids = []
             for layer in layerset.get_layers():
                 # if there is no mask to set and the layer doesn't need a mask removed, skip
                 if layer.mask is None and layer.slug not in geom_lookup:
@@ -486,9 +515,11 @@ class LayerSetView(View):
                     logger.debug(f"removing mask from layer {layer.slug} ({layer.pk})")
                     layer.mask = None
                 layer.save(set_extent=False, skip_map_lookup_update=True)
+                updated_ids.append(layer.pk)
             layerset.multimask_date = datetime.now()
+            layerset.refresh_multimask(save=False)
             layerset.save()
-            layerset.map.update_item_lookup()
+            request_item_lookup_update(layerset.map_id, "layer", updated_ids)
             return JsonResponseSuccess()
 
         if operation == "queue-cog-creation":
@@ -526,20 +557,43 @@ class LayersetDerivativeView(View):
 
         raw = request.GET.get("raw", "false")
 
+        ## the layerset has no modified date of its own, so the ETag covers the fields
+        ## that these responses are made from (mosaic_geotiff changes name when remade)
+        etag_parts = [
+            layerset.pk,
+            layerset.mosaic_geotiff.name,
+            layerset.multimask_date,
+            layerset.tilejson,
+            str(layerset),
+            derivative,
+            raw,
+            settings.TITILER_HOST,
+        ]
+        public = map.access_level == "any"
+
         if derivative == "tilejson" and layerset.tilejson:
-            return JsonResponse(layerset.tilejson)
+            return conditional_response(
+                request,
+                lambda: FastJsonResponse(layerset.tilejson),
+                etag_parts,
+                public=public,
+            )
 
         elif derivative == "qlr":
-            xml_str = generate_qlr_content(layerset)
-            filename = slugify(str(layerset))
 
-            if raw.lower() == "true":
-                return HttpResponse(xml_str, content_type="text/xml")
+            def build_qlr():
+                xml_str = generate_qlr_content(layerset)
+                filename = slugify(str(layerset))
 
-            response = FileResponse(xml_str, content_type="text/xml")
-            response["Content-Length"] = len(xml_str)
-            response["Content-Disposition"] = f'attachment; filename="{filename}.qlr"'
-            return response
+                if raw.lower() == "true":
+                    return HttpResponse(xml_str, content_type="text/xml")
+
+                response = FileResponse(xml_str, content_type="text/xml")
+                response["Content-Length"] = len(xml_str)
+                response["Content-Disposition"] = f'attachment; filename="{filename}.qlr"'
+                return response
+
+            return conditional_response(request, build_qlr, etag_parts, public=public)
 
         elif derivative == "ohm":
             file_url_encoded = quote(get_file_url(layerset, "mosaic_geotiff"), safe="")
@@ -553,15 +607,21 @@ class LayersetDerivativeView(View):
             return redirect(get_file_url(layerset, "mosaic_geotiff"))
 
         elif derivative == "services":
-            file_url_encoded = quote(get_file_url(layerset, "mosaic_geotiff"), safe="")
-            xyz_base = f"{settings.TITILER_HOST}/cog/tiles/WebMercatorQuad/{{z}}/{{x}}/{{y}}.png?"
-            return JsonResponse(
-                {
-                    "xyz": f"{xyz_base}&url={file_url_encoded}",
-                    "wms": f"{settings.TITILER_HOST}/cog/wms/?LAYERS={file_url_encoded}&VERSION=1.1.1",
-                    "tilejson": f"{settings.SITEURL}map/{mapid}/{category}/tilejson",
-                }
-            )
+
+            def build_services():
+                file_url_encoded = quote(get_file_url(layerset, "mosaic_geotiff"), safe="")
+                xyz_base = (
+                    f"{settings.TITILER_HOST}/cog/tiles/WebMercatorQuad/{{z}}/{{x}}/{{y}}.png?"
+                )
+                return JsonResponse(
+                    {
+                        "xyz": f"{xyz_base}&url={file_url_encoded}",
+                        "wms": f"{settings.TITILER_HOST}/cog/wms/?LAYERS={file_url_encoded}&VERSION=1.1.1",
+                        "tilejson": f"{settings.SITEURL}map/{mapid}/{category}/tilejson",
+                    }
+                )
+
+            return conditional_response(request, build_services, etag_parts, public=public)
 
         else:
             raise Http404
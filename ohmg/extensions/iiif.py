@@ -1,9 +1,11 @@
+import hashlib
 import json
 
 from django.conf import settings
 from django.contrib.gis.gdal import CoordTransform, SpatialReference
 from django.contrib.gis.geos import Polygon
-from osgeo import gdal, osr
+from django.core.cache import cache
+from django.db.models import Count, Max
 
 from ohmg.core.models import Layer
 from ohmg.core.utils import full_reverse
@@ -21,6 +23,36 @@ class IIIFResource:
 
         self.d_width, self.d_height = self.document.image_size
 
+    def get_mask_state(self) -> str:
+        """Returns a hash of everything that the mask's selector coordinates depend on."""
+        gcpgroup = self.region.gcpgroup
+        gcps = gcpgroup.gcp_set.aggregate(ct=Count("pk"), modified=Max("last_modified"))
+        state = [
+            self.layer.mask.wkb.hex(),
+            gcpgroup.crs_epsg,
+            gcpgroup.transformation,
+            gcps["ct"],
+            gcps["modified"],
+        ]
+        return hashlib.md5(str(state).encode()).hexdigest()
+
+    def get_mask_selector_coords(self) -> list:
+        mask_geojson = json.loads(self.layer.mask.geojson)
+        coords = mask_geojson["coordinates"][0]
+
+        target_crs = f"EPSG:{self.region.gcpgroup.crs_epsg}"
+        ct = CoordTransform(SpatialReference("WGS84"), SpatialReference(target_crs))
+        polygon = Polygon(coords)
+        polygon.transform(ct)
+
+        g = Georeferencer(
+            crs=target_crs,
+            transformation=self.region.gcpgroup.transformation,
+            gcps_geojson=self.region.gcpgroup.as_geojson,
+        )
+        transposed = g.transform_points(polygon.coords[0], to_pixels=True)
+        return [f"{i[0]},{i[1]}" for i in transposed]
+
     def get_target(self):
         ## create coordinates for the selector
         coords_str = [
@@ -30,40 +62,11 @@ class IIIFResource:
         ## next step is to look for the mask for this layer if one exists, and then
         ## transform it back to the selector coordinates.
         if self.layer.mask:
-            wgs84 = osr.SpatialReference()
-            wgs84.ImportFromEPSG(4326)
-            mask_geojson = json.loads(self.layer.mask.geojson)
-            coords = mask_geojson["coordinates"][0]
-
-            target_crs = f"EPSG:{self.region.gcpgroup.crs_epsg}"
-            ct = CoordTransform(SpatialReference("WGS84"), SpatialReference(target_crs))
-            polygon = Polygon(coords)
-            polygon.transform(ct)
-
-            in_path = (
-                self.region.file.url
-                if self.region.file.url.startswith("http")
-                else self.region.file.path
-            )
-
-            g = Georeferencer(
-                crs=target_crs,
-                transformation=self.region.gcpgroup.transformation,
-                gcps_geojson=self.region.gcpgroup.as_geojson,
-            )
-            g.make_gcps_vrt(in_path)
-            ds = gdal.Open(g.gcps_vrt.get_vsi_url())
-            transformer = gdal.Transformer(
-                # Source datasource
-                ds,
-                # Target datasource
-                None,
-                # Transformer options that are ultimately passed to 'GDALCreateGenImgProjTransformer2()'
-                # https://gdal.org/api/gdal_alg.html#_CPPv432GDALCreateGenImgProjTransformer212GDALDatasetH12GDALDatasetHPPc
-                g.make_transformer_options(),
-            )
-            transposed, status = transformer.TransformPoints(True, polygon.coords[0])
-            coords_str = [f"{i[0]},{i[1]}" for i in transposed]
+            key = f"iiif-mask-selector-{self.layer.pk}-{self.get_mask_state()}"
+            coords_str = cache.get(key)
+            if coords_str is None:
+                coords_str = self.get_mask_selector_coords()
+                cache.set(key, coords_str, timeout=settings.IIIF_CACHE_TIMEOUT)
 
         coords_join = " ".join(coords_str)
 
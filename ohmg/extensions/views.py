@@ -1,30 +1,79 @@
+from django.db.models import Count, Max
 from django.http import JsonResponse
 from django.views import View
 
-from ohmg.conf.http import JsonResponseNotFound
-from ohmg.core.models import Map
+from ohmg.conf.http import JsonResponseNotFound, conditional_response
+from ohmg.core.models import Layer, Map
 from ohmg.core.utils import full_reverse
+from ohmg.places.cache import get_atlascope_footprints, get_payload_versions
 
-from .atlascope import generate_atlascope_footprints
 from .iiif import IIIFResource
 
 
+def get_iiif_validators(layers) -> tuple:
+    """Returns (etag_parts, last_modified) for the IIIF annotations of the given Layer
+    queryset: each annotation depends on its layer (mask), region (boundary, file) and
+    GCPs, so the latest of their modified dates is used, along with the GCP counts, which
+    catch deletions."""
+    rows = list(
+        layers.order_by("pk")
+        .annotate(
+            gcp_ct=Count("region__gcpgroup__gcp"),
+            gcp_modified=Max("region__gcpgroup__gcp__last_modified"),
+        )
+        .values_list(
+            "pk",
+            "last_updated",
+            "region__last_updated",
+            "region__gcpgroup__transformation",
+            "region__gcpgroup__crs_epsg",
+            "gcp_ct",
+            "gcp_modified",
+        )
+    )
+    dates = [d for row in rows for d in (row[1], row[2], row[6]) if d]
+    return rows, max(dates) if dates else None
+
+
+def iiif_response(request, layers, build, *params):
+    etag_parts, last_modified = get_iiif_validators(layers)
+    return conditional_response(
+        request,
+        lambda: JsonResponse(build()),
+        etag_parts + list(params),
+        last_modified,
+    )
+
+
 class IIIFSelectorView(View):
     def get(self, request, layerid):
-        return JsonResponse(IIIFResource(layerid).get_selector())
+        return iiif_response(
+            request,
+            Layer.objects.filter(pk=layerid),
+            lambda: IIIFResource(layerid).get_selector(),
+        )
 
 
 class IIIFGCPView(View):
     def get(self, request, layerid):
-        return JsonResponse(IIIFResource(layerid).get_gcps())
+        return iiif_response(
+            request,
+            Layer.objects.filter(pk=layerid),
+            lambda: IIIFResource(layerid).get_gcps(),
+        )
 
 
 class IIIFResourceView(View):
     def get(self, request, layerid):
         trim = request.GET.get("trim", "false") == "true"
         extended = request.GET.get("extended", "false") == "true"
-        resource = IIIFResource(layerid, trimmed=trim, extended=extended)
-        return JsonResponse(resource.get_annotation())
+        return iiif_response(
+            request,
+            Layer.objects.filter(pk=layerid),
+            lambda: IIIFResource(layerid, trimmed=trim, extended=extended).get_annotation(),
+            trim,
+            extended,
+        )
 
 
 class IIIFMosaicView(View):
@@ -32,8 +81,10 @@ class IIIFMosaicView(View):
         ls = Map.objects.get(pk=mapid).get_layerset(layerset_category)
         trim = request.GET.get("trim", "false") == "true"
         extended = request.GET.get("extended", "false") == "true"
-        return JsonResponse(
-            {
+        return iiif_response(
+            request,
+            ls.get_layers(),
+            lambda: {
                 "id": full_reverse("iiif_canvas_view", args=(mapid, layerset_category)),
                 "type": "AnnotationPage",
                 "@context": [
@@ -44,7 +95,11 @@ class IIIFMosaicView(View):
                     IIIFResource(i.pk, trimmed=trim, extended=extended).get_annotation()
                     for i in [k for k in ls.get_layers()]
                 ],
-            }
+            },
+            mapid,
+            layerset_category,
+            trim,
+            extended,
         )
 
 
@@ -53,8 +108,16 @@ class AtlascopeDataView(View):
         data_name = request.GET.get("data-name")
         match operation:
             case "footprints":
-                topo_json = generate_atlascope_footprints(place, override_data_name=data_name)
-                return JsonResponse(topo_json)
+                versions = get_payload_versions()
+                return conditional_response(
+                    request,
+                    lambda: JsonResponse(
+                        get_atlascope_footprints(
+                            place, override_data_name=data_name, versions=versions
+                        )
+                    ),
+                    [place.pk, data_name, *versions],
+                )
 
             case "coverages":
                 return JsonResponse(
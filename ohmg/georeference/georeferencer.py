@@ -333,6 +333,18 @@ class Georeferencer:
                     f"MAX_GCP_ORDER={self.transformation['gdal_code']}",
                 ]
 
+    def transform_points(self, points: list, to_pixels: bool = False) -> list:
+        """Transforms points from image pixel/line coordinates to CRS coordinates (or
+        back, with to_pixels=True) using only the GCPs and transformation. The GCPs are
+        attached to an empty in-memory dataset, so no VRT or source file is needed."""
+
+        ds = gdal.GetDriverByName("MEM").Create("", 1, 1, 0)
+        ## like the VRTs made by make_gcps_vrt(), the GCPs carry no projection of their own
+        ds.SetGCPs(self.gcps, "")
+        transformer = gdal.Transformer(ds, None, self.make_transformer_options())
+        transformed, status = transformer.TransformPoints(to_pixels, points)
+        return transformed
+
     def cleanup_files(self):
         for vrt in [
             self.gcps_vrt,
@@ -0,0 +1,20 @@
+# Generated by Django 4.2.27 on 2026-10-19 14:02
+
+from django.db import migrations, models
+
+import ohmg.georeference.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('georeference', '0003_job'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='sessionlock',
+            name='expiration',
+            field=models.DateTimeField(db_index=True, default=ohmg.georeference.models.default_expiration_time),
+        ),
+    ]
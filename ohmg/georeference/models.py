@@ -2,6 +2,7 @@ import json
 import logging
 import os
 import uuid
+from collections import Counter
 from datetime import timedelta
 from pathlib import Path
 
@@ -14,9 +15,11 @@ from django.contrib.gis.geos import Point, Polygon
 from django.core.files import File
 from django.core.files.storage import get_storage_class
 from django.core.mail import send_mass_mail
+from django.db import transaction
 from django.utils import timezone
 from osgeo import gdal
 
+from ohmg.core.lookups import request_item_lookup_update
 from ohmg.core.models import (
     Document,
     Layer,
@@ -104,7 +107,7 @@ class GCPGroup(models.Model):
 
     @property
     def gcps(self):
-        return GCP.objects.filter(gcp_group=self)
+        return self.gcp_set.all()
 
     @property
     def gdal_gcps(self):
@@ -154,63 +157,88 @@ class GCPGroup(models.Model):
         return content
 
     def save_from_geojson(self, geojson, region, transformation=None):
-        group = (
-            region.gcpgroup
-            if hasattr(region, "gcpgroup")
-            else GCPGroup.objects.create(region2=region)
-        )
-
-        group.crs_epsg = 3857  # don't see this changing any time soon...
-        group.transformation = transformation
-        group.save()
+        """Sync the GCPs of this region's group with the features in geojson: GCPs that
+        aren't in the features are deleted, new ones are created, and changed ones are
+        updated, each of these in a single query."""
+
+        features = [
+            (i["properties"].get("id") or str(uuid.uuid4()), i) for i in geojson["features"]
+        ]
+        ids = [i[0] for i in features]
+
+        usernames = {i["properties"].get("username") for _, i in features}
+        users = get_user_model().objects.in_bulk(usernames, field_name="username")
+        missing = usernames - set(users.keys())
+        if missing:
+            raise get_user_model().DoesNotExist(f"unknown users in GCPs: {missing}")
+
+        with transaction.atomic():
+            group = (
+                region.gcpgroup
+                if hasattr(region, "gcpgroup")
+                else GCPGroup.objects.create(region2=region)
+            )
 
-        gcps_new, gcps_mod, gcps_del = 0, 0, 0
+            group.crs_epsg = 3857  # don't see this changing any time soon...
+            group.transformation = transformation
+            group.save()
+
+            # first remove any existing gcps that have been deleted
+            gcps_del, _ = group.gcp_set.exclude(pk__in=ids).delete()
+
+            existing = GCP.objects.in_bulk(ids)
+            now = timezone.now()
+            to_create, to_update = [], []
+            for id, feature in features:
+                user = users[feature["properties"].get("username")]
+                gcp = existing.get(uuid.UUID(id))
+                created = gcp is None
+                if created:
+                    gcp = GCP(id=id, gcp_group=group, created_by=user)
+
+                pixel_x = feature["properties"]["image"][0]
+                pixel_y = feature["properties"]["image"][1]
+                new_pixel = (pixel_x, pixel_y)
+                old_pixel = (gcp.pixel_x, gcp.pixel_y)
+                lng = feature["geometry"]["coordinates"][0]
+                lat = feature["geometry"]["coordinates"][1]
+
+                new_geom = Point(lat, lng, srid=4326)
+
+                # only update the point if one of its coordinate pairs have changed,
+                # this also triggered when new GCPs have None for pixels and geom.
+                if (
+                    new_pixel != old_pixel
+                    or not new_geom.equals(gcp.geom)
+                    or gcp.note != feature["properties"]["note"]
+                ):
+                    gcp.note = feature["properties"]["note"]
+                    gcp.pixel_x = new_pixel[0]
+                    gcp.pixel_y = new_pixel[1]
+                    gcp.geom = new_geom
+                    gcp.last_modified_by = user
+                    gcp.last_modified = now
+                    if not created:
+                        to_update.append(gcp)
+                if created:
+                    to_create.append(gcp)
+
+            GCP.objects.bulk_create(to_create)
+            GCP.objects.bulk_update(
+                to_update,
+                ["note", "pixel_x", "pixel_y", "geom", "last_modified_by", "last_modified"],
+            )
 
-        # first remove any existing gcps that have been deleted
-        for gcp in group.gcps:
-            if str(gcp.id) not in [i["properties"].get("id") for i in geojson["features"]]:
-                gcps_del += 0
-                gcp.delete()
+            ## bulk_create() doesn't send post_save, so the creators' counters
+            ## must be updated here (deletes above send post_delete as usual)
+            new_per_user = Counter(i.created_by_id for i in to_create)
+            for user_id, count in new_per_user.items():
+                get_user_model().adjust_counts(user_id, gcp_ct=count)
 
-        for feature in geojson["features"]:
-            id = feature["properties"].get("id", str(uuid.uuid4()))
-            username = feature["properties"].get("username")
-            user = get_user_model().objects.get(username=username)
-            gcp, created = GCP.objects.get_or_create(
-                id=id, defaults={"gcp_group": group, "created_by": user}
-            )
-            if created:
-                gcps_new += 1
-
-            pixel_x = feature["properties"]["image"][0]
-            pixel_y = feature["properties"]["image"][1]
-            new_pixel = (pixel_x, pixel_y)
-            old_pixel = (gcp.pixel_x, gcp.pixel_y)
-            lng = feature["geometry"]["coordinates"][0]
-            lat = feature["geometry"]["coordinates"][1]
-
-            new_geom = Point(lat, lng, srid=4326)
-
-            # only update the point if one of its coordinate pairs have changed,
-            # this also triggered when new GCPs have None for pixels and geom.
-            if (
-                new_pixel != old_pixel
-                or not new_geom.equals(gcp.geom)
-                or gcp.note != feature["properties"]["note"]
-            ):
-                gcp.note = feature["properties"]["note"]
-                gcp.pixel_x = new_pixel[0]
-                gcp.pixel_y = new_pixel[1]
-                gcp.geom = new_geom
-                gcp.last_modified_by = user
-                gcp.save()
-                if not created:
-                    gcps_mod += 1
-        gcps_ct = len(geojson["features"])
         logger.info(
-            f"GCPGroup {group.pk} | GCPs ct: {gcps_ct}, new: {gcps_new}, mod: {gcps_mod}, del: {gcps_del}"
+            f"GCPGroup {group.pk} | GCPs ct: {len(features)}, new: {len(to_create)}, "
+            f"mod: {len(to_update)}, del: {gcps_del}"
         )
-        group.save()
         return group
 
 
@@ -696,7 +724,7 @@ class GeorefSession(SessionBase):
         self.reg2.georeferenced = True
         self.reg2.save()
 
-        self.reg2.map.update_item_lookup()
+        request_item_lookup_update(self.reg2.document.map_id, "layer", [layer.pk])
 
         self.update_stage("finished", save=False)
         self.update_status("success", save=False)
@@ -740,7 +768,7 @@ class SessionLock(models.Model):
     target_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
     target_id = models.PositiveIntegerField()
     target = GenericForeignKey("target_type", "target_id")
-    expiration = models.DateTimeField(default=default_expiration_time)
+    expiration = models.DateTimeField(default=default_expiration_time, db_index=True)
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
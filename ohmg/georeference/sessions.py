@@ -2,6 +2,7 @@ import logging
 from typing import TYPE_CHECKING, Union
 
 from django.contrib.contenttypes.models import ContentType
+from django.db.models import Q
 from django.utils import timezone
 
 if TYPE_CHECKING:
@@ -33,21 +34,44 @@ def remove_lock(
     session.locks.filter(target_type=ct, target_id=obj.pk).delete()
 
 
+def prefetch_locks(objects: list) -> list:
+    """Look up the SessionLocks for any number of Documents, Regions, and/or Layers at
+    once, and attach them so that each object's lock property doesn't run its own
+    queries. Returns the objects as a list."""
+    from .models import SessionLock
+
+    objects = list(objects)
+    targets = {}
+    for obj in objects:
+        ct = ContentType.objects.get_for_model(obj)
+        targets.setdefault(ct.pk, []).append(obj.pk)
+
+    locks = {}
+    if targets:
+        query = Q()
+        for ct_id, ids in targets.items():
+            query |= Q(target_type_id=ct_id, target_id__in=ids)
+        for lock in SessionLock.objects.filter(query).select_related("user", "target_type"):
+            locks.setdefault((lock.target_type_id, lock.target_id), lock)
+
+    for obj in objects:
+        ct = ContentType.objects.get_for_model(obj)
+        obj._lock = locks.get((ct.pk, obj.pk))
+    return objects
+
+
 def delete_expired_session_locks():
     """Look at all current SessionLocks, and if one is expired and it's session is
     still on the "input" stage, then delete the session (the lock will be deleted as well)
     """
-    from .models import SessionBase, SessionLock
-
-    locks = SessionLock.objects.all()
-    if locks.count() > 0:
-        sessions = set([i.session for i in locks])
-        logger.info(f"{locks.count()} SessionLock(s) currently exist from {len(sessions)} sessions")
-    now = timezone.now().timestamp()
-    stale = set()
-    for lock in locks:
-        if now > lock.expiration.timestamp() and lock.session.stage == "input":
-            stale.add(lock.session.pk)
+    from .models import SessionBase
+
+    stale = set(
+        SessionBase.objects.filter(
+            stage="input",
+            locks__expiration__lt=timezone.now(),
+        ).values_list("pk", flat=True)
+    )
 
     if stale:
         logger.info(f"deleting {len(stale)} stale session(s): {','.join([str(i) for i in stale])}")
@@ -3,14 +3,30 @@ import logging
 from django.db.models import signals
 from django.dispatch import receiver
 
-from .models import GeorefSession, PrepSession
+from ohmg.accounts.models import User
+
+from .models import GCP, GeorefSession, PrepSession, SessionBase
 
 logger = logging.getLogger(__name__)
 
+SESH_CT_FIELDS = {"p": "psesh_ct", "g": "gsesh_ct"}
+
 
+## the counters are only adjusted when sessions and GCPs are created or deleted,
+## see User.reconcile_counts() for a full recount. signals for the proxy models are
+## sent with the proxy as sender, while queryset and cascade deletes send SessionBase.
+@receiver([signals.post_save, signals.post_delete], sender=SessionBase)
 @receiver([signals.post_save, signals.post_delete], sender=PrepSession)
 @receiver([signals.post_save, signals.post_delete], sender=GeorefSession)
-def update_user_sesh_cts(sender, instance, **kwargs):
-    if instance.user:
-        logger.debug(f"updating session counts for {instance.user.username}")
-        instance.user.update_sesh_counts()
+def update_user_sesh_cts(sender, instance, created=True, **kwargs):
+    field = SESH_CT_FIELDS.get(instance.type)
+    if created and field:
+        delta = -1 if kwargs["signal"] is signals.post_delete else 1
+        User.adjust_counts(instance.user_id, **{field: delta})
+
+
+@receiver([signals.post_save, signals.post_delete], sender=GCP)
+def update_user_gcp_ct(sender, instance, created=True, **kwargs):
+    if created:
+        delta = -1 if kwargs["signal"] is signals.post_delete else 1
+        User.adjust_counts(instance.created_by_id, gcp_ct=delta)
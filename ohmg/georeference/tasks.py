@@ -6,6 +6,7 @@ from pathlib import Path
 from django.conf import settings
 
 from ohmg.conf.celery import app
+from ohmg.core.lookups import coalesced
 from ohmg.core.models import LayerSet
 from ohmg.core.utils.s3 import get_boto3_s3_client
 
@@ -13,6 +14,7 @@ logger = logging.getLogger(__name__)
 
 
 @app.task
+@coalesced
 def run_preparation_session(sessionid):
     from .models import PrepSession
 
@@ -22,6 +24,7 @@ def run_preparation_session(sessionid):
 
 
 @app.task
+@coalesced
 def bulk_run_preparation_sessions(sessionids):
     from .models import PrepSession
 
@@ -32,6 +35,7 @@ def bulk_run_preparation_sessions(sessionids):
 
 
 @app.task
+@coalesced
 def run_georeference_session(sessionid):
     from .models import GeorefSession
 
@@ -11,6 +11,7 @@ from ohmg.api.schemas import (
     LayerSetSchema,
     MapFullSchema,
     RegionFullSchema,
+    prefetch_layersets,
 )
 from ohmg.conf.http import (
     JsonResponseBadRequest,
@@ -198,10 +199,11 @@ class GeoreferenceView(View):
 
         main_layerset = None
         mc = region.document.map.get_layerset("main-content")
+        akm = region.document.map.get_layerset("key-map")
+        prefetch_layersets([mc, akm])
         if mc:
             main_layerset = LayerSetSchema.from_orm(mc).dict()
         keymap_layerset = None
-        akm = region.document.map.get_layerset("key-map")
         if akm:
             keymap_layerset = LayerSetSchema.from_orm(akm).dict()
 
@@ -0,0 +1,127 @@
+"""
+Versioned cache for the place navigation payloads.
+
+The select lists, breadcrumbs and descendants of a place depend on the volume counts
+of many other places, so rather than tracking which entries are affected by a change,
+every entry includes a global version number in its key. Any change to the place
+hierarchy or to the maps attached to places bumps that version, and all existing
+entries are ignored from then on (and expire after settings.PLACE_CACHE_TIMEOUT).
+
+The site-wide places geojson and the Atlascope footprints are also made from the
+main-content layersets (their extents and masks), so their keys include a second
+version number that is bumped whenever a LayerSet is saved or deleted, or a Map
+field that they show changes.
+
+The versions are only meaningful if every process reads the same cache, see CACHES in
+settings.py.
+"""
+
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+VERSION_KEY = "place-payload-version"
+FOOTPRINT_VERSION_KEY = "layerset-footprint-version"
+REBUILD_PENDING_KEY = "places-geojson-rebuild-pending"
+
+
+def _get_version(key=VERSION_KEY):
+    version = cache.get(key)
+    if version is None:
+        ## start from the current time, so that entries left over from before the
+        ## version key was evicted can't be mistaken for current ones
+        cache.add(key, int(time.time() * 1000), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def _bump_version(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        _get_version(key)
+
+
+def invalidate_place_payloads():
+    _bump_version(VERSION_KEY)
+
+
+def invalidate_footprint_payloads():
+    """Bumps the footprint version, and if settings.PLACES_GEOJSON_REBUILD_DELAY is
+    greater than 0, queues a task to rebuild the places geojson after that many seconds
+    (further changes in the meantime don't queue another), so that it is ready before
+    the next request asks for it."""
+    _bump_version(FOOTPRINT_VERSION_KEY)
+
+    if settings.PLACES_GEOJSON_REBUILD_DELAY > 0:
+        from .tasks import rebuild_places_geojson_as_task
+
+        delay = settings.PLACES_GEOJSON_REBUILD_DELAY
+        if cache.add(REBUILD_PENDING_KEY, True, timeout=delay * 2):
+            transaction.on_commit(
+                lambda: rebuild_places_geojson_as_task.apply_async(countdown=delay)
+            )
+
+
+def clear_rebuild_pending():
+    cache.delete(REBUILD_PENDING_KEY)
+
+
+def get_payload_versions() -> tuple:
+    """Returns the current place and footprint versions, which together identify the
+    current state of every payload cached here (e.g. for use as an ETag)."""
+    return _get_version(VERSION_KEY), _get_version(FOOTPRINT_VERSION_KEY)
+
+
+def _get_cached(name, place, func):
+    key = f"place-{name}-{place.pk}-{_get_version()}"
+    payload = cache.get(key)
+    if payload is None:
+        payload = func(place)
+        cache.set(key, payload, timeout=settings.PLACE_CACHE_TIMEOUT)
+    return payload
+
+
+def get_place_json(place) -> dict:
+    """Returns the PlaceFullSchema serialization of this place."""
+    from ohmg.api.schemas import PlaceFullSchema
+
+    return _get_cached("full", place, lambda p: PlaceFullSchema.from_orm(p).dict())
+
+
+def get_place_serialized(place) -> dict:
+    """Returns the output of place.serialize()."""
+    return _get_cached("serialized", place, lambda p: p.serialize())
+
+
+def get_places_geojson_payload(versions: tuple = None) -> dict:
+    """Returns the geojson of all places with their maps. Pass in the versions that an
+    ETag was made from, so the payload is looked up under the same ones."""
+    from .utils import generate_places_geojson
+
+    versions = versions or get_payload_versions()
+    key = "places-geojson-{}-{}".format(*versions)
+    payload = cache.get(key)
+    if payload is None:
+        payload = generate_places_geojson()
+        cache.set(key, payload, timeout=settings.PLACE_CACHE_TIMEOUT)
+    return payload
+
+
+def get_atlascope_footprints(place, override_data_name: str = None, versions: tuple = None) -> dict:
+    """Returns the Atlascope footprints topojson for this place. Pass in the versions
+    that an ETag was made from, so the payload is looked up under the same ones."""
+    from ohmg.extensions.atlascope import generate_atlascope_footprints
+
+    ## the data name comes from the query string, so hash it to keep the key valid
+    name_hash = hashlib.md5(str(override_data_name).encode()).hexdigest()
+    versions = versions or get_payload_versions()
+    key = f"atlascope-footprints-{place.pk}-{name_hash}-{versions[0]}-{versions[1]}"
+    payload = cache.get(key)
+    if payload is None:
+        payload = generate_atlascope_footprints(place, override_data_name=override_data_name)
+        cache.set(key, payload, timeout=settings.PLACE_CACHE_TIMEOUT)
+    return payload
@@ -0,0 +1,20 @@
+# Generated by Django 4.2.27 on 2026-10-19 18:05
+
+from django.core.management import call_command
+from django.db import migrations
+
+
+def create_cache_table(apps, schema_editor):
+    ## does nothing if the table exists or the cache backend isn't the database
+    call_command('createcachetable', database=schema_editor.connection.alias)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('places', '0002_parcellayer'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_cache_table, migrations.RunPython.noop),
+    ]
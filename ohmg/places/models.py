@@ -2,7 +2,7 @@ import csv
 import logging
 
 from django.contrib.gis.geos import Polygon
-from django.db import models, transaction
+from django.db import connection, models, transaction
 
 from ohmg.core.utils import (
     STATE_ABBREV,
@@ -12,6 +12,42 @@ from ohmg.core.utils import (
 
 logger = logging.getLogger(__name__)
 
+## The hierarchy queries below walk the direct_parents through table, in which
+## from_place_id is the child and to_place_id is the parent. UNION (not UNION ALL)
+## drops rows that have already been visited, so a place that is reachable along
+## more than one path is only returned once.
+
+DESCENDANTS_CTE = """
+    WITH RECURSIVE tree(id) AS (
+        SELECT %s
+        UNION
+        SELECT t.from_place_id
+        FROM {through} t
+        JOIN tree ON t.to_place_id = tree.id
+        JOIN {place} p ON p.id = t.from_place_id
+        WHERE p.volume_count_inclusive > %s
+    )
+"""
+
+ANCESTORS_CTE = """
+    WITH RECURSIVE tree(edge_id, child_id, id) AS (
+        SELECT t.id, t.from_place_id, t.to_place_id
+        FROM {through} t
+        WHERE t.from_place_id = %s
+        UNION
+        SELECT t.id, t.from_place_id, t.to_place_id
+        FROM {through} t
+        JOIN tree ON t.from_place_id = tree.id
+    )
+"""
+
+
+def _format_sql(sql):
+    return sql.format(
+        through=Place.direct_parents.through._meta.db_table,
+        place=Place._meta.db_table,
+    )
+
 
 class Place(models.Model):
     PLACE_CATEGORIES = (
@@ -72,18 +108,9 @@ class Place(models.Model):
 
     @property
     def states(self):
-        candidates = [self]
-        states = []
-        while candidates:
-            new_candidates = []
-            for p in candidates:
-                if p.category == "state":
-                    states.append(p)
-                else:
-                    for i in p.direct_parents.all():
-                        new_candidates.append(i)
-            candidates = new_candidates
-        return list(set(states))
+        if self.category == "state":
+            return [self]
+        return list({i for i in self.get_ancestors() if i.category == "state"})
 
     def get_state_postal(self):
         if self.state and self.state.name.lower() in STATE_POSTAL:
@@ -100,21 +127,40 @@ class Place(models.Model):
     def get_descendants(self):
         return Place.objects.filter(direct_parents__id__exact=self.id).order_by("name")
 
-    def get_breadcrumbs(self):
+    def get_ancestors(self) -> list:
+        """Returns all ancestors of this place, fetched in a single recursive query. Each
+        returned Place has a child_id attribute: the pk of the place it is a parent of
+        (a place with multiple children in the lineage may be returned more than once)."""
+        if self.pk is None:
+            return []
+        sql = _format_sql(
+            ANCESTORS_CTE
+            + (
+                "SELECT p.*, tree.child_id FROM tree JOIN {place} p ON p.id = tree.id "
+                "ORDER BY tree.edge_id"
+            )
+        )
+        return list(Place.objects.raw(sql, [self.pk]))
+
+    def get_lineage(self) -> list:
+        """Returns the chain of places from the top level (e.g. the country) down to this
+        place, following the first parent at each level."""
+        parents = {}
+        for ancestor in self.get_ancestors():
+            parents.setdefault(ancestor.child_id, ancestor)
+        lineage = [self]
+        while lineage[-1].pk in parents and len(lineage) <= len(parents):
+            lineage.append(parents[lineage[-1].pk])
+        lineage.reverse()
+        return lineage
+
+    def get_breadcrumbs(self, lineage: list = None):
         breadcrumbs = []
-        p = self
-        while p.direct_parents.all().count() > 0:
-            parent = p.direct_parents.all()[0]
-            par_name = parent.name
-            if parent.category in ("county", "parish", "borough", "census area"):
-                par_name += f" {parent.get_category_display()}"
-            breadcrumbs.append({"name": par_name, "slug": parent.slug})
-            p = parent
-        breadcrumbs.reverse()
-        name = self.name
-        if self.category in ("county", "parish", "borough", "census area"):
-            name += f" {self.get_category_display()}"
-        breadcrumbs.append({"name": name, "slug": self.slug})
+        for place in lineage if lineage else self.get_lineage():
+            name = place.name
+            if place.category in ("county", "parish", "borough", "census area"):
+                name += f" {place.get_category_display()}"
+            breadcrumbs.append({"name": name, "slug": place.slug})
         return breadcrumbs
 
     def get_select_lists(self):
@@ -180,12 +226,13 @@ class Place(models.Model):
             },
         }
 
-        # take the requested place, and prefill list selections based on its breadcrumbs
-        for n, i in enumerate(self.get_breadcrumbs(), start=1):
-            lists[n]["selected"] = i["slug"]
+        # take the requested place, and prefill list selections based on its lineage
+        lineage = self.get_lineage()
+        for n, i in enumerate(lineage, start=1):
+            lists[n]["selected"] = i.slug
 
         # at this point, at least a country will be selected, get its pk
-        top_pk = Place.objects.get(slug=lists[1]["selected"]).pk
+        top_pk = lineage[0].pk
 
         # always give all of the country options
         all_lvl1 = list(
@@ -206,7 +253,7 @@ class Place(models.Model):
         # if a state is selected, set options to all other states in the same country
         # also, set county/parish and city options for everything within the state
         if lists[2]["selected"] != "---":
-            state_pk = Place.objects.get(slug=lists[2]["selected"]).pk
+            state_pk = lineage[1].pk
             all_lvl3 = list(
                 Place.objects.filter(direct_parents=state_pk, volume_count_inclusive__gt=0).values(
                     "pk", "slug", "display_name", "volume_count_inclusive"
@@ -223,7 +270,7 @@ class Place(models.Model):
 
         # if a county/parish is selected, narrow cities to only those in the county
         if lists[3]["selected"] != "---":
-            ce_pk = Place.objects.get(slug=lists[3]["selected"]).pk
+            ce_pk = lineage[2].pk
             all_lvl4 = list(
                 Place.objects.filter(direct_parents=ce_pk, volume_count_inclusive__gt=0).values(
                     "pk", "slug", "display_name", "volume_count_inclusive"
@@ -237,22 +284,27 @@ class Place(models.Model):
         return lists
 
     def get_inclusive_pks(self):
-        pks = [self.pk]
-        descendants = Place.objects.filter(direct_parents__id__exact=self.id).exclude(
-            volume_count_inclusive=0
+        """Returns the pks of this place and all of its descendants that have at least one
+        volume, fetched in a single recursive query."""
+        with connection.cursor() as cursor:
+            cursor.execute(_format_sql(DESCENDANTS_CTE + "SELECT id FROM tree"), [self.pk, 0])
+            return [row[0] for row in cursor.fetchall()]
+
+    def update_volume_counts(self, delta: int = 1):
+        """Adds delta to the volume count of this place, and to the inclusive volume count
+        of this place and all of its ancestors, in a single UPDATE."""
+        sql = _format_sql(
+            "UPDATE {place} SET "
+            "volume_count = volume_count + CASE WHEN id = %s THEN %s ELSE 0 END, "
+            "volume_count_inclusive = volume_count_inclusive + %s "
+            "WHERE id = %s OR id IN (" + ANCESTORS_CTE + "SELECT id FROM tree)"
         )
-        while descendants:
-            pks += [i.pk for i in descendants]
-            new_descendants = []
-            for d in descendants:
-                new_descendants += [
-                    i
-                    for i in Place.objects.filter(direct_parents__id__exact=d.pk).exclude(
-                        volume_count_inclusive=0
-                    )
-                ]
-            descendants = new_descendants
-        return pks
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [self.pk, delta, delta, self.pk, self.pk])
+
+        from .cache import invalidate_place_payloads
+
+        invalidate_place_payloads()
 
     def serialize(self):
         """TO DEPRECATE: remove this once the Map model schema has been implemented, that's
@@ -309,11 +361,15 @@ class Place(models.Model):
         return coords
 
     def get_parcels(self):
-        def check_parents(place: Place = self):
-            for i in place.direct_parents.all():
-                return i.parcellayer if hasattr(i, "parcellayer") else check_parents(i)
-
-        return self.parcellayer if hasattr(self, "parcellayer") else check_parents()
+        """Returns the ParcelLayer for this place, or for its nearest ancestor that has one."""
+        lineage = self.get_lineage()
+        parcels = {
+            i.locale_id: i for i in ParcelLayer.objects.filter(locale__in=[p.pk for p in lineage])
+        }
+        for place in reversed(lineage):
+            if place.pk in parcels:
+                return parcels[place.pk]
+        return None
 
     def save(self, set_slug=True, *args, **kwargs):
         if set_slug is True:
@@ -0,0 +1,51 @@
+from django.db.models import signals
+from django.dispatch import receiver
+
+from ohmg.core.models import LayerSet, Map
+
+from .cache import invalidate_footprint_payloads, invalidate_place_payloads
+from .models import Place
+
+
+@receiver([signals.post_delete, signals.post_save], sender=Place)
+@receiver([signals.m2m_changed], sender=Place.direct_parents.through)
+@receiver([signals.post_delete], sender=Map)
+@receiver([signals.m2m_changed], sender=Map.locales.through)
+def invalidate_place_cache(sender, **kwargs):
+    invalidate_place_payloads()
+
+
+## Map fields that are shown in the place payloads (see PlaceFullSchema.resolve_maps and
+## Place.serialize), and in the places geojson or the Atlascope footprints
+PLACE_MAP_FIELDS = {"identifier", "title", "year", "volume_number"}
+FOOTPRINT_MAP_FIELDS = PLACE_MAP_FIELDS | {"publisher", "creator", "hidden"}
+
+
+def _get_shown_values(instance) -> dict:
+    ## read from __dict__ so that deferred fields aren't loaded
+    return {i: instance.__dict__.get(i) for i in FOOTPRINT_MAP_FIELDS}
+
+
+@receiver([signals.post_init], sender=Map)
+def store_shown_map_values(sender, instance, **kwargs):
+    instance._shown_values = _get_shown_values(instance)
+
+
+@receiver([signals.post_save], sender=Map)
+def invalidate_caches_on_map_save(sender, instance, created, **kwargs):
+    current = _get_shown_values(instance)
+    if created:
+        changed = FOOTPRINT_MAP_FIELDS
+    else:
+        changed = {i for i in FOOTPRINT_MAP_FIELDS if current[i] != instance._shown_values[i]}
+    instance._shown_values = current
+
+    if changed & PLACE_MAP_FIELDS:
+        invalidate_place_payloads()
+    if changed:
+        invalidate_footprint_payloads()
+
+
+@receiver([signals.post_delete, signals.post_save], sender=LayerSet)
+def invalidate_footprint_cache(sender, **kwargs):
+    invalidate_footprint_payloads()
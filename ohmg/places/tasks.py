@@ -0,0 +1,9 @@
+from ohmg.conf.celery import app
+
+from .cache import clear_rebuild_pending, get_places_geojson_payload
+
+
+@app.task
+def rebuild_places_geojson_as_task():
+    clear_rebuild_pending()
+    get_places_geojson_payload()
@@ -1,4 +1,7 @@
-from ohmg.core.models import Map
+from django.contrib.gis.geos import Polygon
+from django.db.models import F
+
+from ohmg.core.models import LayerSet, Map
 
 from .models import Place
 
@@ -14,3 +17,55 @@ def reset_volume_counts(verbose=False):
         if verbose:
             print(map)
         map.update_place_counts()
+
+
+def generate_places_geojson() -> dict:
+    """Generate geojson for all places with their maps."""
+
+    place_dict = {}
+    for ls in (
+        LayerSet.objects.filter(category__slug="main-content")
+        .prefetch_related()
+        .annotate(
+            locale=F("map__locales"),
+            locale_name=F("map__locales__display_name"),
+            locale_slug=F("map__locales__slug"),
+            map_year=F("map__year"),
+            map_volume_number=F("map__volume_number"),
+        )
+    ):
+        if ls.locale and ls.extent:
+            place_entry = place_dict.get(
+                ls.locale_slug,
+                {
+                    "type": "Feature",
+                    "geometry": {
+                        "type": "Point",
+                        "coordinates": Polygon().from_bbox(ls.extent).centroid.coords,
+                    },
+                    "properties": {
+                        "volumes": [],
+                        "place": {
+                            "url": f"/viewer/{ls.locale_slug}",
+                            "display_name": ls.locale_name,
+                        },
+                    },
+                },
+            )
+            year_vol = (
+                f"{ls.map_year} vol. {ls.map_volume_number}"
+                if ls.map_volume_number
+                else ls.map_year
+            )
+            place_entry["properties"]["volumes"].append(
+                {
+                    "year": year_vol,
+                    "url": f"/map/{ls.map_id}",
+                }
+            )
+            place_dict[ls.locale_slug] = place_entry
+    geojson = {
+        "type": "FeatureCollection",
+        "features": list(place_dict.values()),
+    }
+    return geojson
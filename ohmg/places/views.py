@@ -6,15 +6,16 @@ from natsort import natsorted
 from ohmg.api.schemas import (
     LayerSetDisplaySchema,
     MapListSchema2,
-    PlaceFullSchema,
 )
 from ohmg.conf.http import generate_ohmg_context
 from ohmg.core.models import Map
 
+from .cache import get_place_json, get_place_serialized
+
 
 class PlaceView(View):
     def get(self, request, place):
-        place_json = PlaceFullSchema.from_orm(place).dict()
+        place_json = get_place_json(place)
         context_dict = {
             "PLACE_PARAMS": {
                 "CONTEXT": generate_ohmg_context(request),
@@ -37,7 +38,7 @@ class PlaceView(View):
 class Viewer(View):
     @xframe_options_sameorigin
     def get(self, request, place):
-        place_data = place.serialize()
+        place_data = get_place_serialized(place)
         maps = []
         for map in Map.objects.filter(locales__id__exact=place.id, hidden=False).prefetch_related():
             map_json = MapListSchema2.from_orm(map).dict()
@@ -4,6 +4,7 @@ from pathlib import Path
 from typing import List, Tuple
 
 from django.conf import settings
+from django.core.cache import cache
 from django.core.management import call_command
 from django.test import Client, LiveServerTestCase
 
@@ -88,6 +89,11 @@ class OHMGTestCase(LiveServerTestCase):
             for obj in cls.objects.all():
                 obj.save()
 
+    def setUp(self):
+        super().setUp()
+        ## the cache is shared between processes, so it isn't reset with the database
+        cache.clear()
+
     @classmethod
     def setUpClass(cls):
         super().setUpClass()
@@ -124,3 +130,25 @@ class OHMGTestCase(LiveServerTestCase):
         sys.stdout = open(outfile, "w")
         call_command("dumpdata", model_label, "--indent=2")
         sys.stdout = sysout
+
+
+class FakeResponse:
+    """Stands in for a requests.Response in tests that replace the HTTP session."""
+
+    def __init__(self, status_code: int = 200, content: bytes = b"", headers: dict = None):
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers or {}
+
+    def __bool__(self):
+        return self.status_code < 400
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def iter_content(self, chunk_size=1):
+        for i in range(0, len(self.content), chunk_size):
+            yield self.content[i : i + chunk_size]
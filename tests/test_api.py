@@ -1,6 +1,19 @@
 import json
+import uuid
+from copy import copy
+from datetime import datetime, timedelta, timezone
 
-from django.test import tag
+from django.db import connection
+from django.test import Client, tag
+from django.test.utils import CaptureQueriesContext
+
+from ohmg.accounts import api_keys
+from ohmg.accounts.api_keys import flush_key_counts
+from ohmg.accounts.models import APIKey, User
+from ohmg.api.schemas import LayerSchema, LayerSetSchema, prefetch_layers, prefetch_layersets
+from ohmg.core.models import Document, Layer, LayerSet, Region
+from ohmg.georeference.models import GCP, GCPGroup, PrepSession, SessionBase
+from ohmg.places.cache import get_places_geojson_payload
 
 from .base import OHMGTestCase
 
@@ -35,6 +48,33 @@ class APITestCase(OHMGTestCase):
         response = self.get_api_client().get("/api/beta2/users/")
         self.assertEqual(response.status_code, 200)
 
+    def test_user_api_key(self):
+        key = APIKey.objects.create(account=User.objects.get(username="admin"))
+        client = Client(HTTP_X_API_KEY=key.value)
+
+        flush_key_counts()
+        with self.settings(API_KEY_COUNT_FLUSH_INTERVAL=3600):
+            self.assertEqual(client.get("/api/beta2/places/").status_code, 200)
+        ## usage is counted by pk, so the key value itself is never passed around
+        self.assertEqual(dict(api_keys._counts), {key.pk: 1})
+        flush_key_counts()
+        key.refresh_from_db()
+        self.assertEqual(key.request_count, 1)
+
+        ## saving the key drops its cached status
+        key.active = False
+        key.save()
+        self.assertEqual(client.get("/api/beta2/places/").status_code, 401)
+        self.assertEqual(
+            Client(HTTP_X_API_KEY="not-a-key").get("/api/beta2/places/").status_code, 401
+        )
+
+    def test_json_compression(self):
+        response = self.get_api_client().get("/api/beta2/maps2/", HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertIn("Accept-Encoding", response["Vary"])
+
     def test_places_endpoint(self):
         response = self.get_api_client().get("/api/beta2/places/")
         self.assertEqual(response.status_code, 200)
@@ -43,6 +83,29 @@ class APITestCase(OHMGTestCase):
         response = self.get_api_client().get("/api/beta2/places/geojson/")
         self.assertEqual(response.status_code, 200)
 
+    def test_places_geojson_conditional_get(self):
+        client = self.get_api_client()
+        response = client.get("/api/beta2/places/geojson/")
+        self.assertIn("max-age", response["Cache-Control"])
+
+        response2 = client.get("/api/beta2/places/geojson/", HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response2.status_code, 304)
+        self.assertEqual(response2.content, b"")
+
+    def test_cached_places_geojson(self):
+        get_places_geojson_payload()
+        with CaptureQueriesContext(connection) as ctx:
+            get_places_geojson_payload()
+        self.assertEqual(len(ctx.captured_queries), 0)
+
+        ## saving a layerset changes the version, so the geojson (and ETag) is remade
+        etag = self.get_api_client().get("/api/beta2/places/geojson/")["ETag"]
+        LayerSet.objects.first().save()
+        with CaptureQueriesContext(connection) as ctx:
+            get_places_geojson_payload()
+        self.assertGreater(len(ctx.captured_queries), 0)
+        self.assertNotEqual(self.get_api_client().get("/api/beta2/places/geojson/")["ETag"], etag)
+
     def test_map_endpoint(self):
         response = self.get_api_client().get("/api/beta2/map/?map=sanborn03375_001")
         self.assertEqual(response.status_code, 200)
@@ -81,6 +144,70 @@ class APITestCase(OHMGTestCase):
         data3 = json.loads(response3.content)
         self.assertEqual(data3["count"], 3)
 
+        ## filter items are cached per set of filters, and can be skipped
+        self.assertEqual([i["id"] for i in data3["filter_items"]["types"]], ["p", "g"])
+        response4 = self.get_api_client().get("/api/beta2/sessions/?facets=false")
+        self.assertEqual(json.loads(response4.content)["filter_items"], {})
+
+    def test_sessions_cursor_pagination(self):
+        client = self.get_api_client()
+
+        page1 = json.loads(client.get("/api/beta2/sessions/?limit=2&cursor=").content)
+        self.assertEqual(len(page1["items"]), 2)
+        self.assertIsNone(page1["count"])
+        self.assertIsNone(page1["previous"])
+
+        page2 = json.loads(
+            client.get("/api/beta2/sessions/", {"limit": 2, "cursor": page1["next"]}).content
+        )
+        self.assertEqual(len(page2["items"]), 1)
+        self.assertIsNone(page2["next"])
+
+        back = json.loads(
+            client.get(
+                "/api/beta2/sessions/", {"limit": 2, "cursor": page2["previous"], "count": True}
+            ).content
+        )
+        self.assertEqual([i["id"] for i in back["items"]], [i["id"] for i in page1["items"]])
+        self.assertEqual(back["count"], 3)
+
+        response = client.get("/api/beta2/sessions/", {"cursor": "not-a-cursor"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_cursor_pagination_sub_millisecond(self):
+        admin = User.objects.get(username="admin")
+        for _ in range(2):
+            PrepSession.objects.create(user=admin, doc2=Document.objects.first())
+        ## put every session within the same millisecond, a few microseconds apart
+        base = datetime(2024, 12, 30, 12, 0, 0, 123000, tzinfo=timezone.utc)
+        pks = list(SessionBase.objects.order_by("pk").values_list("pk", flat=True))
+        for n, pk in enumerate(pks):
+            SessionBase.objects.filter(pk=pk).update(date_created=base + timedelta(microseconds=n))
+        expected = list(reversed(pks))
+
+        client = self.get_api_client()
+        pages = [json.loads(client.get("/api/beta2/sessions/?limit=1&cursor=").content)]
+        while pages[-1]["next"]:
+            pages.append(
+                json.loads(
+                    client.get(
+                        "/api/beta2/sessions/", {"limit": 1, "cursor": pages[-1]["next"]}
+                    ).content
+                )
+            )
+        self.assertEqual([p["items"][0]["id"] for p in pages], expected)
+
+        back = [pages[-1]]
+        while back[-1]["previous"]:
+            back.append(
+                json.loads(
+                    client.get(
+                        "/api/beta2/sessions/", {"limit": 1, "cursor": back[-1]["previous"]}
+                    ).content
+                )
+            )
+        self.assertEqual([p["items"][0]["id"] for p in back], pks)
+
     def test_get_layerset_endpoint(self):
         response = self.get_api_client().get(
             "/api/beta2/layerset/?map=sanborn03375_001&category=main-content"
@@ -89,3 +216,169 @@ class APITestCase(OHMGTestCase):
 
         data = json.loads(response.content)
         self.assertEqual(data["map_id"], "sanborn03375_001")
+
+    def test_layers_endpoint(self):
+        response = self.get_api_client().get("/api/beta2/layers/?map=sanborn03375_001")
+        self.assertEqual(response.status_code, 200)
+
+        data = json.loads(response.content)
+        self.assertEqual(len(data), 1)
+        self.assertEqual(len(data[0]["gcps_geojson"]["features"]), 4)
+
+    def test_documents_endpoint_locks(self):
+        """The locks in a document list are looked up in one query, however many there are."""
+        admin = User.objects.get(username="admin")
+        documents = list(Document.objects.filter(map_id="sanborn03375_001").order_by("pk"))
+        client = self.get_api_client()
+        url = "/api/beta2/documents/?map=sanborn03375_001"
+
+        def get_documents():
+            with CaptureQueriesContext(connection) as queries:
+                response = client.get(url)
+            self.assertEqual(response.status_code, 200)
+            return json.loads(response.content), len(queries)
+
+        with self.settings(API_KEY_COUNT_FLUSH_INTERVAL=3600):
+            get_documents()
+
+            PrepSession.objects.create(doc2=documents[0], user=admin).start()
+            data, one_lock_ct = get_documents()
+            locked = [i["id"] for i in data if i["lock"]]
+            self.assertEqual(locked, [documents[0].pk])
+
+            for document in documents[1:]:
+                PrepSession.objects.create(doc2=document, user=admin).start()
+            data, all_locks_ct = get_documents()
+            self.assertTrue(all(i["lock"] for i in data))
+            self.assertEqual(all_locks_ct, one_lock_ct)
+
+    def test_sparse_fields(self):
+        client = self.get_api_client()
+
+        response = client.get("/api/beta2/layers/?map=sanborn03375_001&fields=id,title")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(json.loads(response.content)[0].keys()), {"id", "title"})
+
+        response = client.get("/api/beta2/map/?map=sanborn03375_001&exclude=item_lookup,locks")
+        data = json.loads(response.content)
+        self.assertNotIn("item_lookup", data)
+        self.assertEqual(data["identifier"], "sanborn03375_001")
+
+        response = client.get("/api/beta2/layers/?map=sanborn03375_001&fields=id,nope")
+        self.assertEqual(response.status_code, 400)
+
+    def test_layers_export(self):
+        response = self.get_api_client().get("/api/beta2/layers/export/")
+        self.assertEqual(response.status_code, 200)
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 1)
+        record = json.loads(lines[0])
+        self.assertEqual(record["map"], "sanborn03375_001")
+        self.assertEqual(len(record["gcps_geojson"]["features"]), 4)
+
+        response = self.get_api_client().get(
+            "/api/beta2/layers/export/", {"modified_since": "2100-01-01T00:00:00Z"}
+        )
+        self.assertEqual(b"".join(response.streaming_content), b"")
+
+    def test_layers_spatial_filters(self):
+        ## fixtures are loaded without save(), so footprints must be set here
+        for obj in list(Layer.objects.all()) + list(LayerSet.objects.all()):
+            obj.save()
+        client = self.get_api_client()
+
+        response = client.get("/api/beta2/layers/", {"bbox": "-92.0,29.9,-91.7,30.1"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(json.loads(response.content)), 1)
+
+        response = client.get("/api/beta2/layers/", {"bbox": "-80.0,40.0,-79.0,41.0"})
+        self.assertEqual(len(json.loads(response.content)), 0)
+
+        response = client.get("/api/beta2/layers/", {"near": "-91.82,30.01", "radius": 5000})
+        self.assertEqual(len(json.loads(response.content)), 1)
+
+        response = client.get("/api/beta2/maps2/", {"bbox": "-92.0,29.9,-91.7,30.1"})
+        self.assertEqual(len(json.loads(response.content)["items"]), 1)
+
+        ## geometries in another CRS are transformed, not relabeled
+        ## (the same area as the bbox above, in web mercator)
+        x1, y1, x2, y2 = -10241393, 3490702, -10207997, 3516410
+        mercator_wkt = f"SRID=3857;POLYGON(({x1} {y1},{x2} {y1},{x2} {y2},{x1} {y2},{x1} {y1}))"
+        response = client.get("/api/beta2/layers/", {"intersects": mercator_wkt})
+        self.assertEqual(len(json.loads(response.content)), 1)
+
+        ## without a map, results are paged and the total is given in a header
+        response = client.get("/api/beta2/layers/", {"bbox": "-92.0,29.9,-91.7,30.1"})
+        self.assertEqual(response["X-Total-Count"], "1")
+        self.assertNotIn("Link", response)
+        response = client.get("/api/beta2/layers/", {"bbox": "-92.0,29.9,-91.7,30.1", "offset": 1})
+        self.assertEqual(json.loads(response.content), [])
+        self.assertEqual(response["X-Total-Count"], "1")
+        response = client.get(
+            "/api/beta2/layersets/", {"bbox": "-92.0,29.9,-91.7,30.1", "fields": "id"}
+        )
+        self.assertEqual(response["X-Total-Count"], str(len(json.loads(response.content))))
+
+        with self.settings(SPATIAL_QUERY_MAX_RESULTS=0):
+            response = client.get("/api/beta2/layers/", {"bbox": "-92.0,29.9,-91.7,30.1"})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(json.loads(response.content), [])
+            self.assertEqual(response["X-Total-Count"], "1")
+            response = client.get(
+                "/api/beta2/layers/", {"bbox": "-92.0,29.9,-91.7,30.1", "map": "sanborn03375_001"}
+            )
+            self.assertEqual(len(json.loads(response.content)), 1)
+            self.assertNotIn("X-Total-Count", response)
+
+        response = client.get("/api/beta2/layers/")
+        self.assertEqual(response.status_code, 400)
+
+    def test_serialization_query_counts(self):
+        """Serializing layers and layersets should take a fixed number of queries,
+        regardless of how many layers, GCPs, or jobs are involved."""
+
+        def serialize_layers():
+            with CaptureQueriesContext(connection) as ctx:
+                layers = prefetch_layers(Layer.objects.all())
+                data = [LayerSchema.from_orm(i).dict() for i in layers]
+            return data, len(ctx.captured_queries)
+
+        def serialize_layersets():
+            with CaptureQueriesContext(connection) as ctx:
+                layersets = prefetch_layersets(LayerSet.objects.all())
+                data = [LayerSetSchema.from_orm(i).dict() for i in layersets]
+            return data, len(ctx.captured_queries)
+
+        data, one_layer_ct = serialize_layers()
+        self.assertEqual(len(data), 1)
+        # layers (with regions, gcpgroups, users), gcps (with users)
+        self.assertEqual(one_layer_ct, 2)
+        _, one_layer_layerset_ct = serialize_layersets()
+        # layersets, categories, maps, layers, content type, jobs
+        self.assertLessEqual(one_layer_layerset_ct, 6)
+
+        ## give every other region a copy of the layer, and of its GCPs
+        layer = Layer.objects.get()
+        gcps = list(layer.region.gcpgroup.gcps)
+        regions = list(Region.objects.exclude(pk=layer.region_id))
+        groups = GCPGroup.objects.bulk_create(
+            [GCPGroup(region2=i, crs_epsg=3857, transformation="poly1") for i in regions]
+        )
+        new_gcps = []
+        for group in groups:
+            for gcp in gcps:
+                gcp.pk, gcp.gcp_group = uuid.uuid4(), group
+                new_gcps.append(copy(gcp))
+        GCP.objects.bulk_create(new_gcps)
+        new_layers = []
+        for region in regions:
+            layer.pk, layer.region, layer.slug = None, region, f"{layer.slug}-{region.pk}"
+            new_layers.append(copy(layer))
+        Layer.objects.bulk_create(new_layers)
+
+        data, many_layers_ct = serialize_layers()
+        self.assertEqual(len(data), len(regions) + 1)
+        self.assertTrue(all(len(i["gcps_geojson"]["features"]) == len(gcps) for i in data))
+        self.assertEqual(many_layers_ct, one_layer_ct)
+        _, many_layers_layerset_ct = serialize_layersets()
+        self.assertEqual(many_layers_layerset_ct, one_layer_layerset_ct)
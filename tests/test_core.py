@@ -1,10 +1,20 @@
 import filecmp
+import time
+from datetime import timedelta
 from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest.mock import Mock, patch
 
+import requests
 from django.contrib.auth import get_user_model
+from django.contrib.gis.geos import Polygon
 from django.core.handlers.wsgi import WSGIHandler
+from django.db import connection
 from django.test import Client, tag
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 
+from ohmg.api.schemas import MapFullSchema
 from ohmg.core.importer import DefaultImporter, get_importer
 from ohmg.core.models import (
     Document,
@@ -13,10 +23,13 @@ from ohmg.core.models import (
     Map,
     Region,
 )
-from ohmg.georeference.models import GeorefSession, PrepSession
+from ohmg.core.utils.requests import CacheableRequest, download_image
+from ohmg.core.utils.response_store import ResponseStore
+from ohmg.georeference.models import GCP, GCPGroup, GeorefSession, PrepSession
+from ohmg.georeference.sessions import delete_expired_session_locks, prefetch_locks
 from ohmg.places.models import Place
 
-from .base import DATA_DIR, OHMGTestCase
+from .base import DATA_DIR, FakeResponse, OHMGTestCase
 
 
 @tag("client")
@@ -99,6 +112,19 @@ class ImportersTestCase(OHMGTestCase):
         # for document in map.documents.all():
         #     self.assertTrue(Path(document.file.path).is_file())
 
+    def test_bulk_import_duplicate_paths(self):
+        """Rows that share a document path are rejected before any maps are created,
+        while the other rows in the file are still imported."""
+        importer = get_importer("default")
+
+        results = importer.run_bulk_import(
+            csv_file="tests/data/files/csvs/new-iberia-1885-bulk-load-duplicates.csv",
+        )
+
+        self.assertEqual([r["status"] for r in results], ["invalid", "created", "invalid"])
+        self.assertIn("more than one row", results[0]["errors"][0])
+        self.assertEqual(Map.objects.all().count(), 1)
+
 
 @tag("loc")
 class LOCImporterTestCase(OHMGTestCase):
@@ -159,6 +185,255 @@ class MapTestCase(OHMGTestCase):
         self.assertEqual(len(map.documents.all()), 3)
 
 
+class LoadDocumentFilesTestCase(OHMGTestCase):
+    fixtures = [
+        OHMGTestCase.Fixtures.region_categories,
+        OHMGTestCase.Fixtures.region_categories_sanborn,
+        OHMGTestCase.Fixtures.layerset_categories,
+        OHMGTestCase.Fixtures.layerset_categories_sanborn,
+        OHMGTestCase.Fixtures.admin_user,
+        OHMGTestCase.Fixtures.new_iberia_place,
+        OHMGTestCase.Fixtures.new_iberia_map,
+    ]
+
+    def test_load_all_document_files(self):
+        """One document failing to load doesn't stop the others, documents with no
+        source are skipped, and no document is left marked as loading."""
+        map = Map.objects.get(identifier="sanborn03375_001")
+        map.create_documents()
+        good, broken, no_source = map.documents.order_by("pk")
+        Document.objects.filter(pk=good.pk).update(source_url="https://example.com/good.jpg")
+        Document.objects.filter(pk=broken.pk).update(source_url="https://example.com/broken.jpg")
+        Document.objects.filter(pk=no_source.pk).update(source_url=None, iiif_info=None)
+
+        with open(self.Files.new_iberia_p1_original, "rb") as o:
+            image = o.read()
+        session = Mock()
+        session.get.return_value = FakeResponse(200, image, {"Content-Length": str(len(image))})
+
+        load_file_from_source = Document.load_file_from_source
+
+        def load_or_fail(document, username, overwrite=False, src_file=None):
+            if document.pk == broken.pk:
+                document.loading_file = True
+                document.save(update_fields=["loading_file"])
+                raise OSError("corrupt image")
+            return load_file_from_source(document, username, overwrite, src_file)
+
+        with (
+            TemporaryDirectory() as cache_dir,
+            self.settings(CACHE_DIR=Path(cache_dir)),
+            patch("ohmg.core.utils.requests.get_http_session", return_value=session),
+            patch.object(Document, "load_file_from_source", autospec=True) as load,
+        ):
+            load.side_effect = load_or_fail
+            map.load_all_document_files("admin")
+
+        requested = sorted([i.args[0] for i in session.get.call_args_list])
+        self.assertEqual(
+            requested, ["https://example.com/broken.jpg", "https://example.com/good.jpg"]
+        )
+
+        map.refresh_from_db()
+        self.assertFalse(map.loading_documents)
+        for document in [good, broken, no_source]:
+            document.refresh_from_db()
+            self.assertFalse(document.loading_file)
+        self.assertTrue(Path(good.file.path).is_file())
+        self.assertFalse(broken.file)
+        self.assertFalse(no_source.file)
+
+
+class DownloadImageTestCase(OHMGTestCase):
+    url = "https://example.com/image.jpg"
+
+    def setUp(self):
+        super().setUp()
+        self.tmp_dir = TemporaryDirectory()
+        self.out_path = Path(self.tmp_dir.name, "image.jpg")
+        self.part_path = Path(self.tmp_dir.name, "image.jpg.part")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+        super().tearDown()
+
+    def download(self, *responses):
+        """Run download_image() against a session that returns these responses in
+        order, and return the headers sent with each request."""
+        session = Mock()
+        session.get.side_effect = list(responses)
+        result = download_image(self.url, self.out_path, session=session, backoff=0)
+        self.assertEqual(result, self.out_path)
+        self.assertFalse(self.part_path.exists())
+        return [i.kwargs["headers"] for i in session.get.call_args_list]
+
+    def test_resume(self):
+        self.part_path.write_bytes(b"abc")
+        headers = self.download(FakeResponse(206, b"def", {"Content-Range": "bytes 3-5/6"}))
+        self.assertEqual(headers, [{"Range": "bytes=3-"}])
+        self.assertEqual(self.out_path.read_bytes(), b"abcdef")
+
+    def test_range_not_satisfiable(self):
+        self.part_path.write_bytes(b"junk")
+        headers = self.download(
+            FakeResponse(416),
+            FakeResponse(200, b"full", {"Content-Length": "4"}),
+        )
+        self.assertEqual(headers, [{"Range": "bytes=4-"}, {}])
+        self.assertEqual(self.out_path.read_bytes(), b"full")
+
+    def test_range_ignored(self):
+        """A server that ignores the Range header sends the whole file, which must
+        replace the partial download rather than be appended to it."""
+        self.part_path.write_bytes(b"abc")
+        self.download(FakeResponse(200, b"abcdef", {"Content-Length": "6"}))
+        self.assertEqual(self.out_path.read_bytes(), b"abcdef")
+
+    def test_oversized_part_file(self):
+        """If the download ends up larger than the file, the part file is discarded and
+        the next attempt starts over."""
+        self.part_path.write_bytes(b"0123456789")
+        headers = self.download(
+            FakeResponse(206, b"ab", {"Content-Range": "bytes 10-11/8"}),
+            FakeResponse(200, b"01234567", {"Content-Length": "8"}),
+        )
+        self.assertEqual(headers, [{"Range": "bytes=10-"}, {}])
+        self.assertEqual(self.out_path.read_bytes(), b"01234567")
+
+
+class CacheableRequestTestCase(OHMGTestCase):
+    url = "https://example.com/item.json"
+
+    def setUp(self):
+        super().setUp()
+        tmp_dir = TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.cache_dir = Path(tmp_dir.name)
+        self.store = ResponseStore(self.cache_dir / "responses.sqlite3")
+        self.session = Mock()
+
+        settings_override = self.settings(CACHE_DIR=self.cache_dir)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        for target, value in [
+            ("ohmg.core.utils.requests.get_response_store", self.store),
+            ("ohmg.core.utils.requests.get_http_session", self.session),
+        ]:
+            patcher = patch(target, return_value=value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def store_stale(self, body: bytes, etag: str = None):
+        self.store._put(self.url, "requests", body, etag, None, time.time() - 3600)
+
+    def test_not_modified(self):
+        self.store_stale(b"old", etag='"v1"')
+        self.session.get.return_value = FakeResponse(304)
+
+        self.assertEqual(CacheableRequest(self.url, ttl=60).get_body(), b"old")
+        self.assertEqual(self.session.get.call_args.kwargs["headers"], {"If-None-Match": '"v1"'})
+        self.assertTrue(self.store.get(self.url).is_fresh(60))
+
+    def test_ttl(self):
+        self.store.put(self.url, b"fresh", etag='"v1"')
+        self.assertEqual(CacheableRequest(self.url, ttl=60).get_body(), b"fresh")
+        self.session.get.assert_not_called()
+
+        self.store_stale(b"fresh", etag='"v1"')
+        self.session.get.return_value = FakeResponse(200, b"new", {"ETag": '"v2"'})
+        self.assertEqual(CacheableRequest(self.url, ttl=60).get_body(), b"new")
+        stored = self.store.get(self.url)
+        self.assertEqual((stored.body, stored.etag), (b"new", '"v2"'))
+
+    def test_stale_fallback(self):
+        """If the upstream server can't be reached, a stale copy is better than nothing."""
+        self.store_stale(b"old")
+        self.session.get.side_effect = requests.ConnectionError("unreachable")
+        self.assertEqual(CacheableRequest(self.url, ttl=60).get_body(), b"old")
+
+    def test_legacy_cache_file(self):
+        """Responses in the old one-file-per-url cache are moved into the store."""
+        request = CacheableRequest(self.url, ttl=0)
+        request.cache_path.parent.mkdir(parents=True)
+        request.cache_path.write_bytes(b"legacy")
+
+        self.assertEqual(request.get_body(), b"legacy")
+        self.session.get.assert_not_called()
+        self.assertFalse(request.cache_path.exists())
+        self.assertEqual(self.store.get(self.url).body, b"legacy")
+
+
+class LayerSetTestCase(OHMGTestCase):
+    fixtures = [
+        OHMGTestCase.Fixtures.region_categories,
+        OHMGTestCase.Fixtures.region_categories_sanborn,
+        OHMGTestCase.Fixtures.layerset_categories,
+        OHMGTestCase.Fixtures.layerset_categories_sanborn,
+        OHMGTestCase.Fixtures.admin_user,
+        OHMGTestCase.Fixtures.new_iberia_place,
+        OHMGTestCase.Fixtures.new_iberia_map,
+        OHMGTestCase.Fixtures.new_iberia_docs,
+        OHMGTestCase.Fixtures.gcps_new_iberia_p1__1,
+        OHMGTestCase.Fixtures.gcpgroup_new_iberia_p1__1,
+        OHMGTestCase.Fixtures.new_iberia_reg_1__1_georef,
+        OHMGTestCase.Fixtures.new_iberia_main_layerset,
+        OHMGTestCase.Fixtures.new_iberia_lyr,
+    ]
+
+    def test_refresh_multimask_invalid_mask(self):
+        """A self-intersecting mask is repaired instead of breaking the union."""
+        layer = Layer.objects.first()
+        bowtie = Polygon(
+            ((-91.82, 30.0), (-91.81, 30.01), (-91.81, 30.0), (-91.82, 30.01), (-91.82, 30.0)),
+            srid=4326,
+        )
+        Layer.objects.filter(pk=layer.pk).update(mask=bowtie)
+
+        layerset = layer.layerset2
+        layerset.refresh_multimask()
+        layerset.refresh_from_db()
+
+        self.assertTrue(layerset.multimask.valid)
+        self.assertEqual(len(layerset.multimask_geojson["features"]), 1)
+        self.assertEqual(len(layerset.multimask_extent), 4)
+
+
+class ItemLookupTestCase(OHMGTestCase):
+    fixtures = [
+        OHMGTestCase.Fixtures.region_categories,
+        OHMGTestCase.Fixtures.region_categories_sanborn,
+        OHMGTestCase.Fixtures.layerset_categories,
+        OHMGTestCase.Fixtures.layerset_categories_sanborn,
+        OHMGTestCase.Fixtures.admin_user,
+        OHMGTestCase.Fixtures.new_iberia_place,
+        OHMGTestCase.Fixtures.new_iberia_map,
+        OHMGTestCase.Fixtures.new_iberia_docs,
+        OHMGTestCase.Fixtures.new_iberia_reg_1__1,
+        OHMGTestCase.Fixtures.new_iberia_reg_1__2,
+        OHMGTestCase.Fixtures.new_iberia_reg_1__3,
+        OHMGTestCase.Fixtures.new_iberia_reg_2,
+    ]
+
+    def test_incremental_update_matches_full_rebuild(self):
+        map = Map.objects.get(identifier="sanborn03375_001")
+        map.update_item_lookup()
+        self.assertEqual(map.prepared_ct, 4)
+
+        region = Region.objects.get(pk=2)
+        region.skipped = True
+        region.save(skip_map_lookup_update=True)
+
+        map.update_item_lookup(changed={"region": [region.pk]})
+        map.refresh_from_db()
+        self.assertEqual(map.prepared_ct, 3)
+        self.assertEqual(map.skip_ct, 1)
+
+        incremental = map.item_lookup
+        map.update_item_lookup()
+        map.refresh_from_db()
+        self.assertEqual(incremental, map.item_lookup)
+
+
 @tag("sessions")
 class PreparationSessionTestCase(OHMGTestCase):
     uploaded_files = [
@@ -234,6 +509,57 @@ class PreparationSessionTestCase(OHMGTestCase):
         region = Region.objects.filter(document=document)
         self.assertEqual(region.count(), 1)
 
+    def test_user_session_counts(self):
+        user = get_user_model().objects.get(username="admin")
+        get_user_model().reconcile_counts()
+        user.refresh_from_db()
+        start = user.psesh_ct
+
+        session = PrepSession.objects.create(doc2=Document.objects.get(pk=1), user=user)
+        session.save()
+        user.refresh_from_db()
+        self.assertEqual(user.psesh_ct, start + 1)
+
+        session.delete()
+        user.refresh_from_db()
+        self.assertEqual(user.psesh_ct, start)
+
+    def test_user_session_counts_stale_delete(self):
+        """Sessions removed by the stale session cleanup (a SessionBase queryset delete)
+        are taken off the user's count as well."""
+        user = get_user_model().objects.get(username="admin")
+        get_user_model().reconcile_counts()
+        user.refresh_from_db()
+        start = user.psesh_ct
+
+        session = PrepSession.objects.create(doc2=Document.objects.get(pk=1), user=user)
+        session.start()
+        user.refresh_from_db()
+        self.assertEqual(user.psesh_ct, start + 1)
+
+        session.locks.update(expiration=timezone.now() - timedelta(minutes=1))
+        delete_expired_session_locks()
+        self.assertFalse(PrepSession.objects.filter(pk=session.pk).exists())
+        user.refresh_from_db()
+        self.assertEqual(user.psesh_ct, start)
+
+    def test_session_locks(self):
+        document = Document.objects.get(pk=1)
+        user = get_user_model().objects.get(username="admin")
+
+        session = PrepSession.objects.create(doc2=document, user=user)
+        session.start()
+
+        map_json = MapFullSchema.from_orm(document.map).dict()
+        self.assertEqual([i["target_id"] for i in map_json["locks"]], [document.pk])
+
+        documents = prefetch_locks(Document.objects.filter(map=document.map).order_by("pk"))
+        with CaptureQueriesContext(connection) as queries:
+            locks = [i.lock for i in documents]
+        self.assertEqual(len(queries), 0)
+        self.assertEqual(locks[0].session_id, session.pk)
+        self.assertTrue(all(i is None for i in locks[1:]))
+
 
 @tag("sessions")
 class GeoreferenceSessionTestCase(OHMGTestCase):
@@ -357,3 +683,85 @@ class GeoreferenceSessionTestCase(OHMGTestCase):
         for i in input_gcp_geojson["features"]:
             del i["properties"]["listId"]
         self.assertEqual(region.gcpgroup.as_geojson, input_gcp_geojson)
+
+
+class GCPGroupTestCase(OHMGTestCase):
+    fixtures = [
+        OHMGTestCase.Fixtures.region_categories,
+        OHMGTestCase.Fixtures.region_categories_sanborn,
+        OHMGTestCase.Fixtures.layerset_categories,
+        OHMGTestCase.Fixtures.layerset_categories_sanborn,
+        OHMGTestCase.Fixtures.admin_user,
+        OHMGTestCase.Fixtures.new_iberia_place,
+        OHMGTestCase.Fixtures.new_iberia_map,
+        OHMGTestCase.Fixtures.new_iberia_docs,
+        OHMGTestCase.Fixtures.new_iberia_reg_1__1_georef,
+        OHMGTestCase.Fixtures.gcps_new_iberia_p1__1,
+        OHMGTestCase.Fixtures.gcpgroup_new_iberia_p1__1,
+    ]
+
+    def gcp_feature(self, gcp=None, image=(100, 200), note="", username="admin"):
+        """Make a GCP feature like the georeferencing interface sends. Passing a GCP
+        gives a feature that matches it exactly."""
+        properties = {"image": list(image), "note": note, "username": username}
+        coordinates = [-91.82, 30.01]
+        if gcp:
+            properties.update(id=str(gcp.pk), image=[gcp.pixel_x, gcp.pixel_y], note=gcp.note)
+            ## save_from_geojson() stores the point as (lat, lng)
+            coordinates = [gcp.geom.y, gcp.geom.x]
+        return {
+            "type": "Feature",
+            "properties": properties,
+            "geometry": {"type": "Point", "coordinates": coordinates},
+        }
+
+    def test_save_from_geojson(self):
+        """Add, modify, and delete GCPs in one call."""
+        user = get_user_model().objects.get(username="admin")
+        get_user_model().reconcile_counts()
+        user.refresh_from_db()
+        start_ct = user.gcp_ct
+
+        group = GCPGroup.objects.get(pk=1)
+        region = group.region2
+        kept, modified, *deleted = group.gcps.order_by("pk")
+
+        features = [self.gcp_feature(kept), self.gcp_feature(modified), self.gcp_feature()]
+        features[1]["properties"]["image"] = [1, 2]
+        features[1]["properties"]["note"] = "moved"
+
+        GCPGroup().save_from_geojson(
+            {"type": "FeatureCollection", "features": features}, region, "tps"
+        )
+
+        group.refresh_from_db()
+        self.assertEqual(group.transformation, "tps")
+        self.assertEqual(group.gcp_set.count(), 3)
+        self.assertFalse(GCP.objects.filter(pk__in=[i.pk for i in deleted]).exists())
+
+        self.assertEqual(GCP.objects.get(pk=kept.pk).last_modified, kept.last_modified)
+        modified = GCP.objects.get(pk=modified.pk)
+        self.assertEqual((modified.pixel_x, modified.pixel_y, modified.note), (1, 2, "moved"))
+
+        new = group.gcp_set.exclude(pk__in=[kept.pk, modified.pk]).get()
+        self.assertEqual((new.pixel_x, new.pixel_y), (100, 200))
+        self.assertEqual(new.created_by, user)
+
+        user.refresh_from_db()
+        self.assertEqual(user.gcp_ct, start_ct - len(deleted) + 1)
+        get_user_model().reconcile_counts()
+        user.refresh_from_db()
+        self.assertEqual(user.gcp_ct, start_ct - len(deleted) + 1)
+
+    def test_save_from_geojson_unknown_user(self):
+        """An unknown username is rejected before any GCPs are changed."""
+        group = GCPGroup.objects.get(pk=1)
+        gcp_pks = set(group.gcps.values_list("pk", flat=True))
+
+        features = [self.gcp_feature(), self.gcp_feature(username="nobody")]
+        with self.assertRaises(get_user_model().DoesNotExist):
+            GCPGroup().save_from_geojson(
+                {"type": "FeatureCollection", "features": features}, group.region2
+            )
+
+        self.assertEqual(set(group.gcps.values_list("pk", flat=True)), gcp_pks)
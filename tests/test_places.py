@@ -1,5 +1,10 @@
 from pathlib import Path
 
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from ohmg.core.models import Map
+from ohmg.places.cache import get_place_json
 from ohmg.places.models import Place
 
 from .base import DATA_DIR, OHMGTestCase
@@ -14,3 +19,58 @@ class LoadPlacesTest(OHMGTestCase):
         Place().bulk_load_from_csv(Path(csv_dir, "place_other.csv"))
 
         self.assertEqual(4, Place.objects.all().count())
+
+
+class PlaceHierarchyTest(OHMGTestCase):
+    fixtures = [OHMGTestCase.Fixtures.new_iberia_place]
+
+    def test_hierarchy_queries(self):
+        place = Place.objects.get(slug="new-iberia-la")
+        place.update_volume_counts(1)
+
+        place.refresh_from_db()
+        self.assertEqual((place.volume_count, place.volume_count_inclusive), (1, 1))
+        country = Place.objects.get(slug="united-states")
+        self.assertEqual((country.volume_count, country.volume_count_inclusive), (0, 1))
+
+        self.assertEqual(sorted(country.get_inclusive_pks()), [22, 100, 1551, 17223])
+        self.assertEqual(
+            [i["slug"] for i in place.get_breadcrumbs()],
+            ["united-states", "louisiana", "iberia-parish-la", "new-iberia-la"],
+        )
+        self.assertEqual(place.state.slug, "louisiana")
+
+    def test_cached_place_json(self):
+        place = Place.objects.get(slug="new-iberia-la")
+        self.assertEqual(get_place_json(place)["volume_count"], 0)
+
+        with CaptureQueriesContext(connection) as queries:
+            get_place_json(place)
+        self.assertEqual(len(queries), 0)
+
+        place.update_volume_counts(1)
+        place.refresh_from_db()
+        self.assertEqual(get_place_json(place)["volume_count"], 1)
+
+
+class PlaceCacheTest(OHMGTestCase):
+    fixtures = [
+        OHMGTestCase.Fixtures.admin_user,
+        OHMGTestCase.Fixtures.new_iberia_place,
+        OHMGTestCase.Fixtures.new_iberia_map,
+    ]
+
+    def test_map_edit_invalidates_place_json(self):
+        place = Place.objects.get(slug="new-iberia-la")
+        self.assertEqual(get_place_json(place)["maps"][0]["identifier"], "sanborn03375_001")
+
+        map = Map.objects.get(pk="sanborn03375_001")
+        map.title = "New Iberia, Retitled"
+        map.save()
+        self.assertEqual(get_place_json(place)["maps"][0]["title"], "New Iberia, Retitled")
+
+        ## saving fields that aren't shown keeps the cached payload
+        map.save(update_fields=["document_ct"])
+        with CaptureQueriesContext(connection) as queries:
+            get_place_json(place)
+        self.assertEqual(len(queries), 0)
@@ -52,3 +52,23 @@ class HelmertTransformationTestCase(OHMGTestCase):
             self.assertAlmostEqual(params.rotation, target_rotation)
             self.assertAlmostEqual(params.offset_x, x_offset)
             self.assertAlmostEqual(params.offset_y, y_offset)
+
+
+@tag("warp")
+class TransformPointsTestCase(OHMGTestCase):
+    def test_transform_points_without_vrt(self):
+        gcps = [
+            gdal.GCP(0, 0, 0, 0, 0),
+            gdal.GCP(10, 0, 0, 1, 0),
+            gdal.GCP(0, -10, 0, 0, 1),
+        ]
+        g = Georeferencer(crs="EPSG:3857", transformation="poly1", gcps_gdal=gcps)
+
+        x, y, _ = g.transform_points([(2, 3)])[0]
+        self.assertAlmostEqual(x, 20)
+        self.assertAlmostEqual(y, -30)
+
+        px, line, _ = g.transform_points([(20, -30)], to_pixels=True)[0]
+        self.assertAlmostEqual(px, 2)
+        self.assertAlmostEqual(line, 3)
+        self.assertIsNone(g.gcps_vrt)